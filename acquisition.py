@@ -0,0 +1,250 @@
+import bisect
+from collections import deque
+import logging
+import threading
+import time
+
+from batch_handshake import BatchHandshake
+from scheduler import PlanScheduler
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+
+class SampleRing:
+    # bounded, thread-safe ring of (timestamp, plan index, planned value, live value)
+    def __init__(self, capacity):
+        self._items = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.count = 0  # total samples ever appended
+
+    def append(self, sample):
+        with self._lock:
+            self._items.append(sample)
+            self.count += 1
+
+    def since(self, count):
+        # samples appended after `count` (oldest first) and the new count;
+        # anything already pushed out of the ring is skipped
+        with self._lock:
+            n = min(self.count - count, len(self._items))
+            items = list(self._items)[-n:] if n > 0 else []
+            return items, self.count
+
+    def latest(self):
+        with self._lock:
+            return self._items[-1] if self._items else None
+
+
+def _no_commands(index):
+    return None
+
+
+class AcquisitionEngine:
+    # Polls the PLC on its own thread, walks the test plan on a monotonic clock
+    # (see scheduler.PlanScheduler) and pushes timestamped samples into a
+    # SampleRing. DataCacheMatlab batches are handed to on_batch(timestamp, data_matrix).
+    # velocity_schedule is CompiledPlan.velocity_schedule for Isokinetic sessions;
+    # each command rides along with the acquisition request of its sample.
+    # control is the session used for disable_test_mode (defaults to plc).
+    # Batches come through a BatchHandshake on plc; between plan samples it
+    # is polled at cache_poll_hz (0 turns that off) so a batch is fetched as
+    # soon as the PLC posts it. seq_tag is the PLC's batch counter, if it has
+    # one (see batch_handshake.BatchTracker).
+    def __init__(self, plc, plan, live_tag, lock=None, rate_hz=30,
+                 velocity_schedule=None, ring_seconds=10, on_batch=None,
+                 catch_up="skip", control=None, cache_poll_hz=120, seq_tag=None):
+        self.plc = plc
+        self.control = control or plc
+        self.plan = plan
+        self.live_tag = live_tag
+        self.lock = lock or threading.Lock()
+        self.rate_hz = rate_hz
+        self.on_batch = on_batch
+        self.poll_interval = 1.0 / cache_poll_hz if cache_poll_hz else None
+        self.seq_tag = seq_tag
+        self.handshake = BatchHandshake(plc, seq_tag=seq_tag)
+        self.batches = self.handshake.batches
+        self.cache_polls = 0
+
+        self.ring = SampleRing(int(rate_hz * ring_seconds))
+        self.scheduler = PlanScheduler(len(plan), rate_hz, catch_up=catch_up)
+        self.index = 0
+        self._command_indices, self._command_values = velocity_schedule or ((), ())
+        if not velocity_schedule:
+            self._due_commands = _no_commands  # modes without velocity commands
+        self._next_command = 0
+        self.commands_sent = 0
+        self._retry_limit = None  # velocity limit still to get through
+
+        # link losses (e.g. while ConnectionManager reconnects)
+        self.lost_samples = 0  # plan samples with no PLC data
+        self.lost_commands = 0  # commands that missed their sample
+        self._outage_start = None
+        self.finished_at = None
+        self.finished = threading.Event()
+        self._finish_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None  # thread running the loop
+        self._done = threading.Event()
+        self.error = None  # what stopped the loop early, if anything
+
+    @property
+    def late_ticks(self):
+        return self.scheduler.late_samples
+
+    def timing_report(self):
+        return self.scheduler.report(self.finished_at)
+
+    def link_report(self):
+        return {"lost_samples": self.lost_samples, "lost_commands": self.lost_commands}
+
+    def batch_report(self):
+        report = self.batches.report()
+        report.update(seq_tag=self.seq_tag, cache_polls=self.cache_polls,
+                      cache_poll_hz=round(1 / self.poll_interval) if self.poll_interval else 0)
+        return report
+
+    def start(self, executor=None):
+        # executor: run the loop on a shared pool (see rigs.RigPool) instead
+        # of a thread of its own
+        if executor is not None:
+            executor.submit(self._run)
+        else:
+            threading.Thread(target=self._run, name="acquisition", daemon=True).start()
+
+    def stop(self, disable=True):
+        # early stop (e.g. graph window closed) still takes the PLC out of test mode
+        self._stop.set()
+        if self._worker is not None and self._worker is not threading.current_thread():
+            self._done.wait(timeout=2)
+        if disable and not self.finished.is_set():
+            self._finish()
+
+    def wait(self, timeout=None):
+        # -> True once the loop is over: plan done, stopped or failed
+        return self._done.wait(timeout)
+
+    def _run(self):
+        self._worker = threading.current_thread()
+        try:
+            self._loop()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            log.exception("Acquisition stopped on an error at sample %d", self.index)
+        finally:
+            # a failed loop still takes the PLC out of test mode; after
+            # stop() that is up to stop()
+            if self.error is not None or not self._stop.is_set():
+                try:
+                    self._finish()
+                except Exception:
+                    log.exception("Could not finish the session")
+            self._done.set()
+
+    def _loop(self):
+        scheduler = self.scheduler
+        scheduler.start()
+        next_poll = scheduler.clock()
+        while not self._stop.is_set():
+            step = scheduler.poll()
+            if step is not None:
+                _, self.index = step
+                self._tick(self.index)
+                next_poll = scheduler.clock() + (self.poll_interval or 0)
+            elif scheduler.done():
+                # disable_test_mode fires when the last sample period is over
+                if not self._stop.wait(scheduler.wait_time()):
+                    self._finish()
+                return
+            elif self.poll_interval and scheduler.clock() >= next_poll:
+                self._poll_cache()
+                next_poll = scheduler.clock() + self.poll_interval
+            else:
+                wait = scheduler.wait_time()
+                if self.poll_interval:
+                    wait = min(wait, max(0.0, next_poll - scheduler.clock()))
+                self._stop.wait(wait)
+
+    def _tick(self, index):
+        planned = self.plan[index]
+
+        command = self._due_commands(index)
+        limit = command if command is not None else self._retry_limit
+        timed = TELEMETRY.enabled
+        if timed:
+            t0 = time.perf_counter()
+        with self.lock:
+            frame = self.handshake.poll(velocity_limit=limit) if self.plc else None
+        if timed:
+            TELEMETRY.observe("frame.io", time.perf_counter() - t0)
+        self._track_link(index, frame, limit, command is not None)
+
+        timestamp = time.time()
+        raw_val = 0
+        batch = None
+        if frame:
+            live, batch = frame
+            raw_val = float(live.get(self.live_tag) or 0)
+
+        self.ring.append((timestamp, index, planned, raw_val))
+        if batch is not None:
+            self._hand_on(timestamp, batch)
+
+    def _poll_cache(self):
+        # handshake only; a posted batch is fetched and acknowledged in the
+        # same two round trips as a plan tick
+        self.cache_polls += 1
+        with self.lock:
+            frame = self.handshake.poll(live=False) if self.plc else None
+        if frame and frame[1] is not None:
+            self._hand_on(time.time(), frame[1])
+
+    def _hand_on(self, timestamp, data_matrix):
+        TELEMETRY.count("acq.batches")
+        if self.on_batch:
+            timed = TELEMETRY.enabled
+            if timed:
+                t0 = time.perf_counter()
+            self.on_batch(timestamp, data_matrix)
+            if timed:
+                TELEMETRY.observe("frame.log", time.perf_counter() - t0)
+
+    def _due_commands(self, index):
+        # the limit is state, so after a skipped stretch only the newest
+        # due command needs sending
+        end = bisect.bisect_right(self._command_indices, index, lo=self._next_command)
+        if end == self._next_command:
+            return None
+        self._next_command = end
+        self.commands_sent += 1
+        return int(self._command_values[end - 1])
+
+    def _track_link(self, index, frame, limit, new_command):
+        if frame:
+            self._retry_limit = None
+            if self._outage_start is not None:
+                log.info("PLC data back at sample %d: lost %d samples this outage "
+                         "(%d samples, %d commands in total)", index, index - self._outage_start,
+                         self.lost_samples, self.lost_commands)
+                self._outage_start = None
+            return
+        # the limit is state: keep the newest command queued until it gets through
+        self.lost_samples += 1
+        TELEMETRY.count("acq.lost_samples")
+        if new_command:
+            self.lost_commands += 1
+        self._retry_limit = limit
+        if self._outage_start is None:
+            self._outage_start = index
+            log.warning("No PLC data from sample %d, counting lost samples", index)
+
+    def _finish(self):
+        with self._finish_lock:
+            if self.finished.is_set():
+                return
+            self.finished_at = self.scheduler.clock()
+            if self.control and not self.control.disable_test_mode():
+                self.lost_commands += 1
+                log.error("Could not disable test mode at the end of the plan")
+            self.finished.set()
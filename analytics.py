@@ -0,0 +1,235 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from plan_compiler import FRAME_RATE, compile_plan, stages_from_rows
+from plc_interface import CACHE_COLS
+from session_log import CSV_HEADER, SessionLogReader
+
+log = logging.getLogger(__name__)
+
+# Per-stage metrics over a directory of session logs (.ergolog, or the CSV
+# export when that is all there is), one process per file, streamed in chunks
+# so a file is never loaded whole.
+#
+#   python analytics.py logs/ --out study_summary.csv --workers 8
+#
+# Stages come from the plan recorded in <session>.session.json; samples are
+# placed on the plan's timeline by their position in the log and the PLC
+# sample rate. Units follow the log: torque in Nm, velocity in deg/s.
+
+SUMMARY_FIELDS = [
+    "file", "mode", "session", "stage_index", "stage", "start_s", "end_s",
+    "samples", "contraction_samples", "peak_torque", "impulse", "work",
+    "rms_tracking_error", "fatigue_slope",
+]
+CSV_COLUMNS = {"position": 2, "torque": 3, "velocity": 4, "torque_error": 5}
+
+
+def metadata_for(path):
+    meta_path = os.path.splitext(path)[0] + ".session.json"
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def iter_chunks(path, chunk_rows=65536):
+    # -> dicts of torque/velocity/torque_error arrays, in log order
+    if path.endswith(".ergolog"):
+        reader = SessionLogReader(path)
+        for block in reader.iter_blocks():
+            yield {name: np.asarray(block[name], dtype=float) for name in ("torque", "velocity", "torque_error")}
+        return
+
+    with open(path, newline="") as f:
+        rows = csv.reader(f)
+        next(rows, None)  # header
+        while True:
+            chunk = [row for _, row in zip(range(chunk_rows), rows)]
+            if not chunk:
+                return
+            data = np.array([[row[CSV_COLUMNS[name]] for name in ("torque", "velocity", "torque_error")]
+                             for row in chunk], dtype=float)
+            yield {"torque": data[:, 0], "velocity": data[:, 1], "torque_error": data[:, 2]}
+
+
+def estimate_sample_rate(path, plan_duration):
+    # PLC samples per second. The binary log has batch timestamps: between the
+    # first and last batch read, all but the first batch's samples arrived.
+    # The CSV has none, so its samples are spread over the planned duration.
+    if path.endswith(".ergolog"):
+        reader = SessionLogReader(path)
+        n = len(reader)
+        if n > CACHE_COLS:
+            span = float(reader.block_last("timestamp")) - float(reader.block_first("timestamp")[0])
+            if span > 0:
+                return (n - CACHE_COLS) / span
+        return None
+    if not plan_duration:
+        return None
+    with open(path, newline="") as f:
+        n = sum(1 for _ in f) - 1
+    return n / plan_duration if n > 0 else None
+
+
+class StageAccumulator:
+    # running per-stage sums, updated one chunk at a time with bincount
+    def __init__(self, n_stages):
+        self.n = n_stages
+        z = lambda: np.zeros(n_stages)
+        self.samples, self.contraction = z(), z()
+        self.peak = np.full(n_stages, -np.inf)
+        self.torque_sum, self.work_sum, self.err2_sum = z(), z(), z()
+        # least-squares torque-vs-time over contraction samples
+        self.st, self.sy, self.sty, self.stt = z(), z(), z(), z()
+
+    def add(self, stage, t, contracting, torque, velocity, error):
+        n = self.n
+        count = lambda w=None: np.bincount(stage, weights=w, minlength=n)[:n]
+        self.samples += count()
+        self.torque_sum += count(torque)
+        self.work_sum += count(torque * np.deg2rad(velocity))
+        self.err2_sum += count(error * error)
+        np.maximum.at(self.peak, stage, torque)
+
+        c = contracting
+        sc, tc, yc = stage[c], t[c], torque[c]
+        cc = lambda w=None: np.bincount(sc, weights=w, minlength=n)[:n]
+        self.contraction += cc()
+        self.st += cc(tc)
+        self.sy += cc(yc)
+        self.sty += cc(tc * yc)
+        self.stt += cc(tc * tc)
+
+    def rows(self, dt):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rms = np.sqrt(self.err2_sum / self.samples)
+            k = self.contraction
+            slope = (k * self.sty - self.st * self.sy) / (k * self.stt - self.st ** 2)
+        slope[k < 2] = np.nan
+        peak = np.where(self.samples > 0, self.peak, np.nan)
+        return {
+            "samples": self.samples.astype(int),
+            "contraction_samples": self.contraction.astype(int),
+            "peak_torque": peak,
+            "impulse": self.torque_sum * dt,
+            "work": self.work_sum * dt,
+            "rms_tracking_error": rms,
+            "fatigue_slope": slope,
+        }
+
+
+def analyze_session(path, chunk_rows=65536, sample_rate=None):
+    # -> one summary row per plan stage (or a single "session" row without a plan)
+    meta = metadata_for(path)
+    frame_rate = meta.get("frame_rate", FRAME_RATE)
+    plan = compile_plan(stages_from_rows(meta.get("stages") or []), frame_rate)
+    rate = sample_rate or estimate_sample_rate(path, plan.duration)
+    if not rate:
+        raise ValueError(f"{path}: can't work out the sample rate, pass --sample-rate")
+    dt = 1.0 / rate
+
+    if len(plan):
+        names = [stage.name for stage in plan.stages]
+        bounds = plan.stage_starts / frame_rate  # stage start times, plus the end
+        signal = plan.signal
+    else:
+        names = ["session"]
+        bounds = np.array([0.0, np.inf])
+        signal = None
+
+    acc = StageAccumulator(len(names))
+    seen = 0
+    for chunk in iter_chunks(path, chunk_rows):
+        torque = chunk["torque"]
+        t = (seen + np.arange(len(torque))) * dt
+        seen += len(torque)
+        # samples past the planned end go to the last stage
+        stage = np.clip(np.searchsorted(bounds, t, "right") - 1, 0, len(names) - 1)
+        if signal is not None:
+            plan_index = np.minimum((t * frame_rate).astype(np.int64), len(signal) - 1)
+            contracting = signal[plan_index] > 0
+        else:
+            contracting = np.ones(len(t), dtype=bool)
+        acc.add(stage, t, contracting, torque, chunk["velocity"], chunk["torque_error"])
+
+    metrics = acc.rows(dt)
+    rows = []
+    for i, name in enumerate(names):
+        row = {
+            "file": os.path.basename(path),
+            "mode": meta.get("mode"),
+            "session": meta.get("session"),
+            "stage_index": i,
+            "stage": name,
+            "start_s": round(float(bounds[i]), 3),
+            "end_s": round(float(min(bounds[i + 1], seen * dt)), 3),
+        }
+        for key, values in metrics.items():
+            value = values[i]
+            row[key] = int(value) if key.endswith("samples") else round(float(value), 6)
+        rows.append(row)
+    return rows
+
+
+def find_logs(paths):
+    # .ergolog files, plus CSVs that have no binary log next to them
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.path.join(path, n) for n in os.listdir(path))
+        else:
+            names = [path]
+        for name in names:
+            base, ext = os.path.splitext(name)
+            if ext == ".ergolog" or (ext == ".csv" and not os.path.exists(base + ".ergolog")
+                                     and _is_session_csv(name)):
+                found.append(name)
+    return found
+
+
+def _is_session_csv(path):
+    # skips summaries and other CSVs that live next to the logs
+    with open(path, newline="") as f:
+        return next(csv.reader(f), None) == CSV_HEADER
+
+
+def analyze_many(paths, out_path, workers=None, chunk_rows=65536, sample_rate=None):
+    files = find_logs(paths)
+    failed = 0
+    with open(out_path, "w", newline="") as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        futures = {pool.submit(analyze_session, p, chunk_rows, sample_rate): p for p in files}
+        for future in as_completed(futures):
+            try:
+                writer.writerows(future.result())
+            except Exception as e:
+                failed += 1
+                log.error("Skipping %s: %s", futures[future], e)
+    log.info("Analyzed %d of %d session logs -> %s", len(files) - failed, len(files), out_path)
+    return len(files) - failed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage metrics for a set of session logs")
+    parser.add_argument("paths", nargs="+", help="session logs or directories of them")
+    parser.add_argument("--out", default="summary.csv")
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    parser.add_argument("--chunk-rows", type=int, default=65536, help="CSV rows read at a time")
+    parser.add_argument("--sample-rate", type=float, help="PLC samples per second, if not estimated")
+    args = parser.parse_args(argv)
+    _, failed = analyze_many(args.paths, args.out, args.workers, args.chunk_rows, args.sample_rate)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    sys.exit(main())
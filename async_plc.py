@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from plc_interface import COMM_ERRORS, CACHE_TAG, CACHE_ROWS, CACHE_COLS, cache_matrix
+
+log = logging.getLogger(__name__)
+
+# Awaitable front end for a PLCInterface session.
+#
+# Calls are queued to one worker thread that owns the driver (pycomm3 isn't
+# thread safe). Callers don't wait for each other: while a request is on the
+# wire the next ones queue up, and the worker packs runs of queued reads (or
+# writes) into a single multi-service request. Failures raise PLCError
+# subclasses instead of printing and returning None/False.
+
+
+class PLCError(Exception):
+    pass
+
+
+class PLCNotConnectedError(PLCError):
+    pass
+
+
+class PLCCommError(PLCError):
+    # the transport failed; the session has been dropped for reconnection
+    pass
+
+
+class PLCTimeoutError(PLCError):
+    pass
+
+
+class PLCTagError(PLCError):
+    # errors: {tag: error text} for the tags the controller rejected
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(", ".join(f"{tag}: {err}" for tag, err in errors.items()))
+
+
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ("kind", "args", "future")
+
+    def __init__(self, kind, args):
+        self.kind = kind  # "read", "write" or "data_cache"
+        self.args = args
+        self.future = None
+
+
+class AsyncPLCInterface:
+    #   plc       - a PLCInterface; its lock and connection are shared, so a
+    #               ConnectionManager can keep reconnecting it underneath
+    #   timeout   - default seconds per call; a request still queued when it
+    #               times out is never sent
+    #   max_batch - most queued requests packed into one round trip
+    def __init__(self, plc, timeout=2.0, max_batch=32):
+        self.plc = plc
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.requests = 0      # calls made
+        self.round_trips = 0   # driver requests they turned into
+
+        self._queue = queue.Queue()
+        self._held = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="plc-async", daemon=True)
+        self._thread.start()
+        self._loop = None
+        self._loop_thread = None
+
+    # --- awaitable API ---------------------------------------------------
+
+    async def read(self, tag, timeout=None):
+        (value,) = await self._call("read", (tag,), timeout)
+        return value
+
+    async def read_many(self, *tags, timeout=None):
+        return await self._call("read", tags, timeout)
+
+    async def write(self, tag, value, timeout=None):
+        await self._call("write", ((tag, value),), timeout)
+
+    async def write_many(self, *tags_values, timeout=None):
+        await self._call("write", tags_values, timeout)
+
+    async def read_data_cache(self, timeout=None):
+        # -> 6x10 matrix when a new batch was waiting (and acknowledged), else None
+        return await self._call("data_cache", (), timeout)
+
+    async def enable_test_mode(self, mode_value, timeout=None):
+        await self._call("write", (('matlabTestMode', mode_value), ('matlabTestingEnabled', 1)), timeout)
+
+    async def disable_test_mode(self, timeout=None):
+        await self._call("write", (('matlabTestingEnabled', 0),), timeout)
+
+    async def start_pretension(self, timeout=None):
+        await self._call("write", (('matlabPretensionEnable', 1),), timeout)
+
+    async def _call(self, kind, args, timeout):
+        future = asyncio.wrap_future(self.submit(kind, args))
+        try:
+            return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            raise PLCTimeoutError(f"{kind} {args} timed out") from None
+
+    def submit(self, kind, args):
+        # -> concurrent.futures.Future, for callers without an event loop
+        if self._closed:
+            raise PLCError("AsyncPLCInterface is closed")
+        request = _Request(kind, tuple(args))
+        request.future = Future()
+        self.requests += 1
+        self._queue.put(request)
+        return request.future
+
+    # --- Tk --------------------------------------------------------------
+
+    def run_in_tk(self, widget, coro, on_result=None, on_error=None, poll_ms=10):
+        # Runs `coro` on a private event loop thread and hands the outcome back
+        # on the Tk thread via widget.after, so the mainloop never blocks:
+        #   api.run_in_tk(root, api.start_pretension(), on_result=..., on_error=...)
+        future = asyncio.run_coroutine_threadsafe(coro, self._event_loop())
+
+        def check():
+            if not future.done():
+                widget.after(poll_ms, check)
+                return
+            error = future.exception()
+            if error is None:
+                if on_result:
+                    on_result(future.result())
+            elif on_error:
+                on_error(error)
+            else:
+                log.error("PLC request failed: %s", error)
+
+        widget.after(poll_ms, check)
+        return future
+
+    def _event_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="plc-async-loop", daemon=True
+            )
+            self._loop_thread.start()
+        return self._loop
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join(timeout=5)
+
+    # --- worker ----------------------------------------------------------
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                with self.plc.lock:
+                    driver = self.plc.plc
+                    if driver is None:
+                        raise PLCNotConnectedError(f"PLC {self.plc.ip} not connected")
+                    self._execute(driver, batch)
+            except PLCError as e:
+                self._fail(batch, e)
+            except Exception as e:
+                self._fail(batch, self._comm_error(e))
+
+    def _next_batch(self):
+        # one request, plus whatever queued behind it of the same kind
+        first = self._held if self._held is not None else self._queue.get()
+        self._held = None
+        if first is _STOP:
+            return None
+        batch = [first]
+        if first.kind == "data_cache":
+            return batch
+        while len(batch) < self.max_batch:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is _STOP or request.kind != first.kind:
+                self._held = request
+                break
+            batch.append(request)
+        return batch
+
+    def _execute(self, driver, batch):
+        kind = batch[0].kind
+        if kind == "data_cache":
+            self._set(batch[0], self._data_cache(driver))
+            return
+
+        items = [item for request in batch for item in request.args]
+        self.round_trips += 1
+        results = driver.read(*items) if kind == "read" else driver.write(*items)
+        if len(items) == 1:
+            results = [results]
+
+        pos = 0
+        for request in batch:
+            mine = results[pos:pos + len(request.args)]
+            pos += len(request.args)
+            errors = {r.tag: r.error for r in mine if r.error is not None}
+            if errors:
+                self._fail([request], PLCTagError(errors))
+            elif kind == "read":
+                self._set(request, [r.value for r in mine])
+            else:
+                self._set(request, None)
+
+    def _data_cache(self, driver):
+        self.round_trips += 1
+        flag, block = driver.read('NewDataFlag', f'{CACHE_TAG}{{{CACHE_ROWS * CACHE_COLS}}}')
+        errors = {r.tag: r.error for r in (flag, block) if r.error is not None}
+        if errors:
+            raise PLCTagError(errors)
+        if flag.value != 1:
+            return None
+        self.round_trips += 1
+        ack = driver.write(('NewDataFlag', 0))
+        if ack.error is not None:
+            raise PLCTagError({ack.tag: ack.error})
+        return cache_matrix(block.value)
+
+    def _comm_error(self, e):
+        if isinstance(e, COMM_ERRORS):
+            self.plc._check_comm_error(e)
+            return PLCCommError(str(e))
+        return PLCError(f"{type(e).__name__}: {e}")
+
+    @staticmethod
+    def _set(request, value):
+        if not request.future.done():
+            request.future.set_result(value)
+
+    @staticmethod
+    def _fail(batch, error):
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(error)
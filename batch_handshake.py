@@ -0,0 +1,81 @@
+import logging
+
+from plc_interface import LIVE_TAGS
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+VELOCITY_LIMIT_TAG = 'matlabVelocityLimit'
+
+
+class BatchTracker:
+    # Accounts for DataCacheMatlab batches against the PLC's batch counter
+    # (plc_interface.BATCH_SEQ_TAG). A jump of more than one means the PLC
+    # refilled the cache before we acknowledged it; the same count twice means
+    # we read one batch again (e.g. the flag reset didn't get through).
+    # Without the counter only received batches can be counted.
+    def __init__(self):
+        self.batches = 0
+        self.missed = 0
+        self.duplicates = 0
+        self.last_seq = None
+
+    def accept(self, seq=None):
+        # -> False for a batch that was already handed on
+        if seq is not None:
+            if self.last_seq is not None:
+                gap = (seq - self.last_seq) % 2**32  # DINT wraps
+                # warn on the first one; a steady overrun would flood the log
+                if gap == 0:
+                    self.duplicates += 1
+                    TELEMETRY.count("acq.batches_duplicate")
+                    log.log(logging.WARNING if self.duplicates == 1 else logging.DEBUG,
+                            "Batch %d read twice, dropping the repeat", seq)
+                    return False
+                if gap > 1:
+                    first = not self.missed
+                    self.missed += gap - 1
+                    TELEMETRY.count("acq.batches_missed", gap - 1)
+                    log.log(logging.WARNING if first else logging.DEBUG,
+                            "Missed %d batch(es) before batch %d", gap - 1, seq)
+            self.last_seq = seq
+        self.batches += 1
+        return True
+
+    def report(self):
+        return {
+            "batches": self.batches,
+            "missed_batches": self.missed if self.last_seq is not None else None,
+            "duplicate_batches": self.duplicates if self.last_seq is not None else None,
+        }
+
+
+class BatchHandshake:
+    # The DataCacheMatlab handshake for one session on the streaming PLC
+    # session. Each poll is one PLCInterface.read_frame: a request for the
+    # live tags, NewDataFlag, the cache block and the batch counter (seq_tag,
+    # when the program has it), then one that acknowledges a posted batch
+    # together with the velocity limit write, if any. Batches are checked
+    # against the counter before they are handed on.
+    def __init__(self, plc, live_tags=LIVE_TAGS, seq_tag=None):
+        self.plc = plc
+        self.seq_tag = seq_tag
+        self.batches = BatchTracker()
+        seq_tags = (seq_tag,) if seq_tag else ()
+        self._tick_tags = tuple(live_tags) + seq_tags
+        self._poll_tags = seq_tags
+
+    def poll(self, live=True, velocity_limit=None):
+        # -> None when the PLC didn't answer, else (live values, batch); batch
+        #    is None when none was posted or it was already handed on.
+        #    live=False reads only what the handshake needs (cache polling).
+        writes = ((VELOCITY_LIMIT_TAG, velocity_limit),) if velocity_limit is not None else ()
+        frame = self.plc.read_frame(self._tick_tags if live else self._poll_tags, writes=writes)
+        if not frame:
+            return None
+        values, batch = frame
+        if batch is None:
+            TELEMETRY.count("acq.empty_polls")
+        elif not self.batches.accept(values.get(self.seq_tag) if self.seq_tag else None):
+            batch = None
+        return values, batch
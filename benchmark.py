@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from acquisition import AcquisitionEngine
+from plc_interface import BATCH_SEQ_TAG, MODE_LIVE_TAGS, PLCInterface
+from plan_compiler import FRAME_RATE, compile_plan, stages_from_rows
+from plan_compiler import velocity_schedule as velocity_schedule_for
+from plc_simulator import SimulatedLogixDriver
+from presets import PRESET_NAMES, PRESETS
+from session_log import CSV_HEADER, BinarySessionLog
+
+# Runs the same pipeline as InputTable.start_live_graph (acquisition engine,
+# per-frame ring drain, session log) against the PLC simulator
+# for every mode and built-in preset, and prints one JSON document.
+#
+#   python benchmark.py --seconds 10 --latency 0.004 --out bench.json
+
+FLUSH_INTERVAL = 15
+
+
+class TimedEngine(AcquisitionEngine):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tick_durations = []
+
+    def _tick(self, index):
+        t0 = time.perf_counter()
+        super()._tick(index)
+        self.tick_durations.append(time.perf_counter() - t0)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[int(round(q / 100 * (len(ordered) - 1)))]
+
+
+def ms_summary(values):
+    return {
+        "p50": _ms(percentile(values, 50)),
+        "p99": _ms(percentile(values, 99)),
+        "max": _ms(max(values) if values else None),
+        "mean": _ms(sum(values) / len(values) if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def run_case(mode, preset_number, args, out_dir):
+    plan = compile_plan(stages_from_rows(PRESETS[mode][preset_number]), FRAME_RATE)
+    signal = plan.signal
+    if args.seconds:
+        signal = signal[:int(args.seconds * FRAME_RATE)]
+    velocity_schedule = velocity_schedule_for(signal) if mode == "Isokinetic" else None
+    case = {
+        "mode": mode,
+        "preset": preset_number,
+        "preset_name": PRESET_NAMES[mode][preset_number - 1],
+        "plan_samples": len(signal),
+        "plan_seconds": len(signal) / FRAME_RATE,
+        "target_hz": FRAME_RATE,
+    }
+    if not len(signal):
+        case["skipped"] = "empty plan"
+        return case
+
+    drivers = []
+
+    def factory(ip):
+        driver = SimulatedLogixDriver(ip, latency=args.latency, jitter=args.jitter,
+                                      fill_rate=args.fill_rate, seed=args.seed)
+        drivers.append(driver)
+        return driver
+
+    plc = PLCInterface('sim', driver_factory=factory)
+    plc.connect()
+    sim = drivers[0]
+
+    csv_filename = os.path.join(out_dir, f"{mode}_{preset_number}.csv")
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    logged = [0]
+
+    if args.log == "binary":
+        # current pipeline: copy into the binary log, export CSV at close
+        session_log = BinarySessionLog(os.path.join(out_dir, f"{mode}_{preset_number}.ergolog"),
+                                       mode=mode, session=ts, export_csv=csv_filename)
+
+        def log_batch(timestamp, data_matrix):
+            session_log.append_batch(timestamp, data_matrix)
+            logged[0] = session_log.rows
+
+        # nothing to flush per frame: the writer thread writes in the
+        # background, and the CSV export at close shows up in log_close_ms
+        flush_log = None
+
+        def close_log():
+            session_log.close()
+    else:
+        # pre-binary pipeline: Python rows flushed as CSV text every FLUSH_INTERVAL frames
+        with open(csv_filename, "w", newline="") as f:
+            csv.writer(f).writerow(CSV_HEADER)
+        log_buffer = []
+        log_lock = threading.Lock()
+
+        def log_batch(timestamp, data_matrix):
+            with log_lock:
+                for c in range(10):
+                    logged[0] += 1
+                    log_buffer.append([float(logged[0]), ts, data_matrix[0][c], data_matrix[1][c],
+                                       data_matrix[2][c], data_matrix[3][c]])
+
+        def flush_log():
+            nonlocal log_buffer
+            with log_lock:
+                rows, log_buffer = log_buffer, []
+            if rows:
+                with open(csv_filename, "a", newline="") as f:
+                    csv.writer(f).writerows(rows)
+
+        close_log = flush_log
+
+    engine = TimedEngine(plc, signal, MODE_LIVE_TAGS[mode], rate_hz=FRAME_RATE,
+                         velocity_schedule=velocity_schedule, on_batch=log_batch,
+                         cache_poll_hz=args.cache_poll_hz, seq_tag=BATCH_SEQ_TAG)
+
+    requests_before = sim.requests
+    frame_durations = []
+    flush_durations = []
+    frames = 0
+    seen = 0
+    period = 1.0 / FRAME_RATE
+
+    start = time.perf_counter()
+    engine.start()
+    next_t = time.monotonic()
+    while True:
+        # stand-in for update(): drain the ring, flush CSV rows every FLUSH_INTERVAL frames
+        t0 = time.perf_counter()
+        samples, seen = engine.ring.since(seen)
+        if not samples and engine.finished.is_set():
+            break
+        frames += 1
+        if flush_log and frames % FLUSH_INTERVAL == 0:
+            tf = time.perf_counter()
+            flush_log()
+            flush_durations.append(time.perf_counter() - tf)
+        frame_durations.append(time.perf_counter() - t0)
+
+        next_t += period
+        delay = next_t - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.perf_counter() - start
+
+    tf = time.perf_counter()
+    close_log()
+    close_duration = time.perf_counter() - tf
+    plc.disconnect()
+
+    ticks = len(engine.tick_durations)
+    case.update({
+        "elapsed_s": round(elapsed, 3),
+        "ticks": ticks,
+        "acq_hz": round(ticks / elapsed, 2),
+        "frames": frames,
+        "frame_hz": round(frames / elapsed, 2),
+        "late_ticks": engine.late_ticks,
+        "velocity_commands": engine.commands_sent,
+        "timing": engine.timing_report(),
+        "tick_latency_ms": ms_summary(engine.tick_durations),
+        "frame_latency_ms": ms_summary(frame_durations),
+        "round_trips": sim.requests - requests_before,
+        "round_trips_per_tick": round((sim.requests - requests_before) / ticks, 3) if ticks else None,
+        "log_format": args.log,
+        # per-frame CSV flushes (csv pipeline only); the binary log's cost is
+        # its close: draining the writer and exporting the CSV
+        "log_flush_ms": (dict(ms_summary(flush_durations), total=_ms(sum(flush_durations)))
+                         if flush_log else None),
+        "log_close_ms": _ms(close_duration),
+        "samples_logged": logged[0],
+        "batches_filled": sim.batches_filled,
+        "batches_dropped": sim.batches_dropped,
+        "batch_handshake": engine.batch_report(),
+    })
+    return case
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ergometer session throughput/latency benchmark")
+    parser.add_argument("--seconds", type=float, default=10,
+                        help="cap each plan to this many seconds (0 = full plan)")
+    parser.add_argument("--modes", nargs="+", default=list(PRESETS), choices=list(PRESETS))
+    parser.add_argument("--latency", type=float, default=0.003, help="simulated seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.001, help="simulated latency jitter (s)")
+    parser.add_argument("--fill-rate", type=float, default=30, help="DataCacheMatlab batches per second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-poll-hz", type=float, default=120,
+                        help="NewDataFlag polling between plan samples (0 = plan ticks only)")
+    parser.add_argument("--log", choices=("binary", "csv"), default="binary",
+                        help="session log pipeline to measure")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    cases = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for mode in args.modes:
+            for preset_number in sorted(PRESETS[mode]):
+                # diagnostics go to logging (stderr), so stdout is only the JSON
+                case = run_case(mode, preset_number, args, out_dir)
+                print(f"{mode} #{preset_number}: {case.get('acq_hz', '-')} Hz", file=sys.stderr)
+                cases.append(case)
+
+    report = {
+        "benchmark": "session",
+        "version": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "cases": cases,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
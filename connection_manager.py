@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+
+from plc_interface import PLCInterface, PLC_IP, LogixDriver
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+DEGRADED = "degraded"  # one of the two sessions is down
+
+
+class ConnectionManager:
+    # Keeps two sessions to one controller open from a background thread:
+    #   control - UI writes: parameters, test mode, pretension, end of session
+    #   stream  - the acquisition engine's polling
+    # Sessions that drop (see PLCInterface._check_comm_error) are reopened
+    # with exponential backoff; idle ones get a keepalive read so the CIP
+    # session doesn't time out (a session acquisition keeps busy needs none,
+    # see PLCInterface.last_ok).
+    def __init__(self, ip=PLC_IP, driver_factory=LogixDriver, keepalive_tag='matlabTestMode',
+                 keepalive_interval=2.0, backoff_initial=0.5, backoff_max=10.0, on_state=None,
+                 fast_start=False):
+        self.ip = ip
+        self.control = PLCInterface(ip, driver_factory, fast_start=fast_start)
+        self.stream = PLCInterface(ip, driver_factory, fast_start=fast_start)
+        self.keepalive_tag = keepalive_tag
+        self.keepalive_interval = keepalive_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.on_state = on_state  # called from the manager thread
+
+        self.state = DISCONNECTED
+        self.outages = 0
+        self.last_outage = None  # (started, ended) monotonic times
+        self._sessions = {
+            "control": {"plc": self.control, "backoff": 0.0, "retry_at": 0.0},
+            "stream": {"plc": self.stream, "backoff": 0.0, "retry_at": 0.0},
+        }
+        self._down_since = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._set_state(CONNECTING)
+        self._thread = threading.Thread(target=self._run, name="plc-connection", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.control.disconnect()
+        self.stream.disconnect()
+        self._set_state(DISCONNECTED)
+
+    def status_text(self):
+        text = f"PLC {self.ip}: {self.state}"
+        if self.outages:
+            text += f" ({self.outages} outage{'s' if self.outages != 1 else ''})"
+        return text
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                self._pass()
+                failures = 0
+                delay = 0.25
+            except Exception:
+                # keep reconnecting for the life of the process whatever one
+                # pass ran into
+                failures += 1
+                delay = min(self.backoff_max, self.backoff_initial * 2 ** (failures - 1))
+                log.exception("PLC connection manager pass failed, retrying in %.1fs", delay)
+            self._stop.wait(delay)
+
+    def _pass(self):
+        now = time.monotonic()
+        if self.state == CONNECTED and self._down_since is None and not self._all_up():
+            self._down_since = now
+            self.outages += 1
+            TELEMETRY.count("link.outages")
+            log.warning("PLC link lost, reconnecting")
+        for session in self._sessions.values():
+            if session["plc"].connected:
+                self._keepalive(session, now)
+            elif now >= session["retry_at"]:
+                self._reconnect(session, now)
+        self._update_state()
+
+    def _keepalive(self, session, now):
+        plc = session["plc"]
+        if now - plc.last_ok < self.keepalive_interval:
+            return
+        # a failed read drops the session inside PLCInterface
+        plc.read_many(self.keepalive_tag)
+
+    def _reconnect(self, session, now):
+        if session["plc"].connect():
+            session["backoff"] = 0.0
+        else:
+            session["backoff"] = min(self.backoff_max, max(self.backoff_initial, session["backoff"] * 2))
+            session["retry_at"] = now + session["backoff"]
+
+    def _all_up(self):
+        return all(s["plc"].connected for s in self._sessions.values())
+
+    def _update_state(self):
+        up = [s["plc"].connected for s in self._sessions.values()]
+        if all(up):
+            state = CONNECTED
+        elif any(up):
+            state = DEGRADED
+        else:
+            state = CONNECTING if self.state == CONNECTING else DISCONNECTED
+
+        now = time.monotonic()
+        if state == CONNECTED and self._down_since is not None:
+            self.last_outage = (self._down_since, now)
+            log.info("PLC link restored after %.1fs", now - self._down_since)
+            self._down_since = None
+        self._set_state(state)
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        if self.on_state:
+            self.on_state(state)
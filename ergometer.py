@@ -0,0 +1,189 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from connection_manager import CONNECTED
+from parameter_sync import ParameterConflictError
+from plc_interface import PLC_IP, TEST_MODES
+from presets import PresetLibrary
+from rigs import RigPool, load_rig_specs
+from session_config import build_session_config
+from telemetry import TELEMETRY, configure_logging
+
+log = logging.getLogger("ergometer")
+
+# Headless session runner: the same plan compiler, PLC writes, acquisition
+# engine and session log as the live graph, without Tk or matplotlib.
+#
+#   python -m ergometer run --mode Isokinetic --preset 2 --out logs/
+#   python -m ergometer run --mode Isometric --preset 1 --torque-target 40 --simulator --repeat 20
+#   python -m ergometer run --mode Isokinetic --preset 2 --rigs lab_rigs.json --out logs/
+#   python -m ergometer replay logs/Isokinetic_20250101_120000.ergolog --speed 10
+
+# command line option -> spinbox label it stands in for (see parameter_sync.SPINBOX_TAGS)
+PARAMETER_OPTIONS = {
+    "torque_target": "Torque Target (Nm)",
+    "min_torque": "Min Torque Threshold (Nm)",
+    "range": "Range of Motion (deg)",
+}
+
+
+def connect(args):
+    # one rig from --ip/--simulator, or every rig in --rigs
+    if args.rigs:
+        specs = load_rig_specs(args.rigs)
+    else:
+        specs = [{"name": "sim" if args.simulator else args.ip,
+                  "ip": "sim" if args.simulator else args.ip}]
+    pool = RigPool(specs, stream_port=args.stream_port, shm=args.shm)
+    pool.start()
+    deadline = time.monotonic() + args.connect_timeout
+    while not all(rig.link.state == CONNECTED for rig in pool):
+        if time.monotonic() > deadline:
+            down = [rig.ip for rig in pool if rig.link.state != CONNECTED]
+            pool.stop()
+            raise SystemExit(f"PLC {', '.join(down)} not reachable after {args.connect_timeout:.0f}s")
+        time.sleep(0.1)
+    return pool
+
+
+def start_session(rig, config, args, out_dir):
+    control = rig.plc
+    parameters = dict(config.parameters)
+
+    if not control.enable_test_mode(config.test_mode):
+        raise SystemExit(f"{rig.name}: could not enable test mode")
+    try:
+        # {} means nothing changed; None (write failed) and False (not
+        # connected) both leave the PLC on other values than the log records
+        written = control.write_parameters(parameters) if parameters else {}
+        if written is None or written is False:
+            control.disable_test_mode()
+            raise SystemExit(f"{rig.name}: could not write session parameters")
+    except ParameterConflictError as e:
+        control.disable_test_mode()
+        raise SystemExit(str(e))
+
+    session = rig.new_session(config, out_dir=out_dir, export_csv=args.csv,
+                              cache_poll_hz=args.cache_poll_hz, preset=args.preset, headless=True,
+                              log_codec=None if args.codec == "none" else args.codec,
+                              log_max_bytes=int(args.max_log_mb * 1e6) if args.max_log_mb else None)
+    log.info("%s session %s: %s preset %d, %.0fs -> %s", rig.name, session.ts, args.mode, args.preset,
+             config.plan.duration, session.paths["log"])
+    session.start()
+    return session
+
+
+def run_sessions(pool, config, args, stop):
+    # the protocol on every rig at once; -> {rig name: summary}
+    out = {rig.name: args.out if len(pool) == 1 else os.path.join(args.out, rig.name) for rig in pool}
+    sessions = [start_session(rig, config, args, out[rig.name]) for rig in pool]
+    # wait() also returns for a loop that failed, so a dead session can't hang the run
+    while not all(s.engine.wait(1.0 / len(sessions)) for s in sessions):
+        if stop["requested"]:
+            log.warning("Interrupted, stopping the session")
+            for session in sessions:
+                session.stop()
+            break
+    return {rig.name: rig.session.finish(interrupted=stop["requested"]) for rig in pool}
+
+
+def cmd_run(args):
+    library = PresetLibrary()
+    names = library.names(args.mode)
+    if not 1 <= args.preset <= len(names):
+        raise SystemExit(f"{args.mode} has presets 1-{len(names)}: {', '.join(names)}")
+    plan = library.plan(library.get(args.mode, args.preset))
+    if not len(plan):
+        raise SystemExit(f"{args.mode} preset {args.preset} has no enabled stages")
+    parameters = {label: getattr(args, opt) for opt, label in PARAMETER_OPTIONS.items()
+                  if getattr(args, opt) is not None}
+    config = build_session_config(args.mode, plan, parameters)
+
+    if args.telemetry:
+        TELEMETRY.enable(snapshot_path=args.telemetry)
+
+    # first Ctrl-C/SIGTERM ends the current session cleanly (test mode off, log closed)
+    stop = {"requested": False}
+
+    def request_stop(signum, frame):
+        if stop["requested"]:
+            raise KeyboardInterrupt
+        stop["requested"] = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    pool = connect(args)
+    runs = []
+    try:
+        for i in range(args.repeat):
+            if stop["requested"]:
+                break
+            if i and args.pause:
+                time.sleep(args.pause)
+            runs.append(run_sessions(pool, config, args, stop))
+    finally:
+        pool.stop()
+        TELEMETRY.disable()
+
+    # one summary per run, keyed by rig when there are several
+    summaries = [run if args.rigs else next(iter(run.values())) for run in runs]
+    json.dump(summaries if args.repeat > 1 or not summaries else summaries[0], sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    failed = any(summary.get("error") for run in runs for summary in run.values())
+    return 1 if stop["requested"] or failed else 0
+
+
+def cmd_replay(args):
+    import replay  # Tk + matplotlib, only for this command
+    return replay.main([args.log, "--speed", str(args.speed)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ergometer", description="Headless ergometer sessions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run a preset protocol without the UI")
+    run.add_argument("--mode", required=True, choices=list(TEST_MODES))
+    run.add_argument("--preset", type=int, required=True)
+    run.add_argument("--out", default="logs", help="directory for the session log and metadata")
+    run.add_argument("--ip", default=PLC_IP)
+    run.add_argument("--simulator", action="store_true", help="use the in-process PLC simulator")
+    run.add_argument("--rigs", help="rig list (JSON) to run the protocol on all of them at once")
+    run.add_argument("--torque-target", type=float, help="Isometric torque target (Nm)")
+    run.add_argument("--min-torque", type=float, help="Isokinetic minimum torque threshold (Nm)")
+    run.add_argument("--range", type=float, help="range of motion (deg)")
+    run.add_argument("--cache-poll-hz", type=float, default=250,
+                     help="NewDataFlag polling between plan samples")
+    run.add_argument("--repeat", type=int, default=1, help="run the protocol this many times (soak tests)")
+    run.add_argument("--pause", type=float, default=0, help="seconds between repeats")
+    run.add_argument("--no-csv", dest="csv", action="store_false", help="skip the CSV export")
+    run.add_argument("--codec", choices=["zlib", "lzma", "none"], default="zlib",
+                     help="session log compression")
+    run.add_argument("--max-log-mb", type=float, help="start a new log part past this size")
+    run.add_argument("--stream-port", type=int,
+                     help="publish live batches on this localhost port (0: any free port; "
+                          "rig i of --rigs gets port + i)")
+    run.add_argument("--shm", action="store_true", help="publish live batches in shared memory as well")
+    run.add_argument("--telemetry", help="write a telemetry snapshot to this JSON file")
+    run.add_argument("--connect-timeout", type=float, default=15)
+    run.add_argument("-v", "--verbose", action="store_true")
+    run.set_defaults(func=cmd_run)
+
+    replay = sub.add_parser("replay", help="play a recorded session back in the live graph view")
+    replay.add_argument("log", help="session .ergolog file")
+    replay.add_argument("--speed", type=float, default=1, help="playback speed (1-100)")
+    replay.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    configure_logging(logging.DEBUG if getattr(args, "verbose", False) else logging.INFO)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import numpy as np
+
+from pacing import BlitManager
+from plot_window import MirroredRing, PlanWindow
+
+
+class LiveGraphView:
+    # The live graph figure: planned trace across the window, live trace up to
+    # its center, and a status line. Only the animated artists are redrawn
+    # (BlitManager). Used by the live session and by session replay.
+    def __init__(self, master, mode, signal, frame_rate, window_seconds=4):
+        self.window_size = int(frame_rate * window_seconds)
+        # time_data = np.linspace(-window_seconds, 0, window_size)
+        time_data = np.linspace(-window_seconds / 2, window_seconds / 2, self.window_size)
+        center_index = self.window_size // 2
+
+        # bigger figure
+        self.fig, ax = plt.subplots(figsize=(12, 8), dpi=100)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.widget = self.canvas.get_tk_widget()
+
+        # planned trace is a view into the compiled plan, live trace a ring
+        # that ends at the center of the window
+        self.plan_window = PlanWindow(signal, self.window_size)
+        self.live_ring = MirroredRing(center_index + 1)
+        input_data = np.zeros(self.window_size)
+
+        # choose labels based on mode
+        if mode in ("Isotonic", "Isokinetic"):
+            planned_lbl = "Planned Position (%)"
+            live_lbl    = "Live Position (%)"
+            ylabel      = "Position (%)"
+        else:
+            planned_lbl = "Planned Input"
+            live_lbl    = "Live Torque (%)"
+            ylabel      = "Torque (%)"
+
+        self.input_line, = ax.plot(
+            time_data, input_data,
+            label=planned_lbl,
+            color="blue",
+            linewidth=10
+        )
+        self.live_line, = ax.plot(
+            time_data[:center_index + 1], self.live_ring.view(),
+            label=live_lbl,
+            color="orange",
+            linewidth=10
+        )
+
+        ax.set_ylim(0, 110)
+        ax.set_xlim(-window_seconds / 2, window_seconds / 2)
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel(ylabel)
+        ax.legend()
+        ax.grid(True)
+        self.ax = ax
+
+        # dropped/late frames are drawn on the plot itself
+        self.status_text = ax.text(0.01, 0.98, "", transform=ax.transAxes, va="top",
+                                   fontsize=10, color="dimgray")
+        self.blitter = BlitManager(self.canvas, [self.input_line, self.live_line, self.status_text])
+
+    def push(self, values):
+        # live values (already scaled), oldest first
+        self.live_ring.extend(values)
+
+    def show(self, index):
+        # planned trace up to plan sample `index`, live trace from the ring
+        self.input_line.set_ydata(self.plan_window.view(index))
+        self.live_line.set_ydata(self.live_ring.view())
+
+    def clear(self):
+        self.live_ring.clear()
+
+    def set_status(self, text):
+        self.status_text.set_text(text)
+
+    def update(self):
+        self.blitter.update()
+
+    def draw(self):
+        self.canvas.draw()
+
+    def close(self):
+        self.blitter.disconnect()
+        plt.close(self.fig)
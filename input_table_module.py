@@ -1,32 +1,34 @@
-from datetime import datetime
-from decimal import Decimal
-import os
+import logging
 import tkinter as tk
-import csv
-from tkinter import filedialog, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.animation as animation
-import numpy as np
-import time
+from tkinter import messagebox, simpledialog
 from plc_interface import PLCInterface
+from parameter_sync import ParameterConflictError
+from presets import PresetLibrary
+from stage_table import StageModel, VirtualStageTable
 import threading
 
-plc_lock= threading.Lock()
+# matplotlib, numpy and the modules built on them are imported on first use
+# (build_test_plan / start_live_graph) so the app window comes up fast
+
+log = logging.getLogger(__name__)
+
 
 class InputTable:
-    def __init__(self, root, mode=None, plc=None, lock = plc_lock):
+    # rig: a rigs.Rig to run on (its sessions, lock and pool); otherwise plc,
+    # stream and lock are used as given
+    def __init__(self, root, mode=None, plc=None, lock=None, stream=None, library=None, rig=None):
         self.root = root
+        self.library = library or PresetLibrary()
         self.mode = mode
+        self.rig = rig
+        if rig is not None:
+            plc, stream, lock = rig.plc, rig.stream, rig.lock
         self.plc=plc
-        self.ani = None
-        self.plc_lock = lock
-        self.csv_index = 1
-
-
-        self.log_buffer = []
-        self.flush_interval = 15  # frames
-        self.frame_counter  = 0
+        self.stream = stream or plc  # separate streaming session for acquisition, if any
+        self.pacer = None
+        # per-connection lock, so tables on different rigs never wait on each other
+        self.plc_lock = lock or (self.stream.lock if self.stream else threading.Lock())
+        self.session = None
 
         if mode == "Isometric":
             self.columns = ["Name", "Time(s)", "Target (% of Max Torque)", "Cont. Time(s)", "Rest Time(s)", "Enable"]
@@ -87,12 +89,9 @@ class InputTable:
             self.create_spinbox(self.spinbox_frame, "Range of Motion (deg):", 0, 2)
            
 
-        
 
 
-        
-
-        # Mouse scrolling (cross-platform)
+        # Mouse scrolling (cross-platform); the stage table handles its own
         def _on_mousewheel(event):
             canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
         canvas.bind_all("<MouseWheel>", _on_mousewheel)
@@ -104,71 +103,17 @@ class InputTable:
             self.scrollable_frame.grid_columnconfigure(col, weight=1, minsize=100)
         self.scrollable_frame.grid_columnconfigure(0, weight=2, minsize=100)
 
-
-        
-
-       
-        # mouse stuff
-        def _on_mousewheel(event):
-            canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
-
-        canvas.bind_all("<MouseWheel>", _on_mousewheel)
-        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
-
-
-        for col in range(len(self.columns)):
-            self.scrollable_frame.grid_columnconfigure(col, weight=1, minsize=100)
-        self.scrollable_frame.grid_columnconfigure(0, weight=2, minsize=100)
-
-        self.entries = []
-        self.vars = []
-
-        for col, col_name in enumerate(self.columns):
-            label = tk.Label(self.scrollable_frame, text=col_name, borderwidth=1, relief="solid",
-                             font=("Times New Roman", 12, "bold"))
-            label.grid(row=1, column=col, sticky="nsew")
-
-        for row in range(2, 18):
-            row_entries = []
-            for col in range(len(self.columns) - 1):
-                entry_width = 25 if col == 0 else 15
-                entry = tk.Entry(self.scrollable_frame, relief="solid", width=entry_width, font=("Georgia", 15))
-                entry.grid(row=row, column=col, sticky="nsew", padx=1, pady=1)
-                row_entries.append(entry)
-
-            var = tk.BooleanVar()
-            cb = tk.Checkbutton(self.scrollable_frame, variable=var)
-            cb.grid(row=row, column=len(self.columns) - 1, sticky="nsew", padx=1, pady=1)
-            self.vars.append(var)
-            self.entries.append(row_entries)
+        # the stages live in the model; the table only has widgets for the
+        # 16 rows on screen, however long the protocol is
+        self.model = StageModel()
+        self.table = VirtualStageTable(self.scrollable_frame, self.model, self.columns, bg=bg_color)
+        self.table.frame.grid(row=1, column=0, columnspan=len(self.columns), sticky="nsew")
 
         # Preset buttons
        # Preset buttons next to the "Enable" column (i.e., column 6)
-        preset_frame = tk.Frame(self.scrollable_frame, bg=bg_color)
-        preset_frame.grid(row=1, column=len(self.columns), rowspan=21, sticky="nsw", padx=(10, 0), pady=(5, 5))
-
-        preset_label = tk.Label(preset_frame, text="Presets", font=("Georgia", 10, "bold"), bg=bg_color)
-        preset_label.pack(pady=(0, 5))
-
-        preset_names = {
-            "Isometric": ["MVIC", "ISO RAMP", "Isometric Preset 3"],
-            "Isotonic": ["Isotonic Preset 1", "Isotonic Preset 2", "Isotonic Preset 3"],
-            "Isokinetic": ["Frequency Ramp", "Oxidative Capacity", "Practice"]
-        }
-
-        # Fallback in case mode is not set
-        names = preset_names.get(self.mode, ["Preset 1", "Preset 2", "Preset 3"])
-
-        for i, label in enumerate(names):
-            btn = tk.Button(
-                preset_frame,
-                text=label,
-                command=lambda i=i+1: self.load_preset(i),  # preset_number starts from 1
-                font=("Georgia", 10),
-                width=18
-            )
-            btn.pack(pady=2)
+        self.preset_frame = tk.Frame(self.scrollable_frame, bg=bg_color)
+        self.preset_frame.grid(row=1, column=len(self.columns), sticky="nsw", padx=(10, 0), pady=(5, 5))
+        self.build_preset_buttons()
         
 
         # start_plot_button = tk.Button(self.scrollable_frame, text="Start Live Graph", command=self.start_live_graph)
@@ -191,15 +136,15 @@ class InputTable:
         if self.plc:
             success = self.plc.start_pretension()  # You must implement start_pretension()
             if success:
-                print("Pretension routine started.")
+                log.info("Pretension routine started")
                 self.blink_count = 0
                 self.blinking = True
                 self.blink_light()
             else:
-                print("Pretension Failed")
+                log.error("Pretension failed")
         else:
             # Just blink light as fallback
-            print("No PLC connected, blinking light only.")
+            log.warning("No PLC connected, blinking light only")
             self.blink_count = 0
             self.blinking = True
             self.blink_light()
@@ -221,320 +166,194 @@ class InputTable:
             self.blinking = False
 
 
+    def build_preset_buttons(self):
+        bg_color = self.preset_frame["bg"]
+        for child in self.preset_frame.winfo_children():
+            child.destroy()
+
+        preset_label = tk.Label(self.preset_frame, text="Presets", font=("Georgia", 10, "bold"), bg=bg_color)
+        preset_label.pack(pady=(0, 5))
+
+        # built-ins plus the user's saved protocols for this mode
+        for i, label in enumerate(self.library.names(self.mode)):
+            btn = tk.Button(
+                self.preset_frame,
+                text=label,
+                command=lambda i=i+1: self.load_preset(i),  # preset_number starts from 1
+                font=("Georgia", 10),
+                width=18
+            )
+            btn.pack(pady=2)
+
+        tk.Button(self.preset_frame, text="Save as Preset...", command=self.save_preset,
+                  font=("Georgia", 10, "italic"), width=18).pack(pady=(8, 2))
+
     def load_preset(self, preset_number):
-    # Example hardcoded presets; customize as needed
-        presets = {
-            "Isometric": {
-                1: [["Rest", "5", "0", "0", "5", True], 
-                    ["Contraction", "4", "100", "4", "0", True],
-                    ["Recovery","5","0","0","5", True]],
-                    
-                2: [["Rest","90",	"0",	"0",	"90"	,True],
-                    ["Stage 1",	"595",	"20",	"2",	"3",	True],
-                    ["MVIC",	"5",	"100"	,"3",	"2",	True],
-                    ["Stage 2"	,"595",	"40",	"2"	,"3",	True],
-                    ["MVIC"	,"5"	,"100",	"3",	"2",	True],
-                    ["Stage 3","595"	,"60"	,"2"	,"3",	True],
-                    ["MVIC"	,"5"	,"100",	"3",	"2",	True],
-                    ["Recovery",	"5",	"0"	,"0",	"5",	True]],
-                    
-                3: [["D", "3", "50", "1.5", "1.5", True]]
-            },
-            "Isotonic": {
-                1: [["Rest",	"2",	"0",	"0",	"2",	True], 
-                    ["Contraction set",	"2"	,"100",	"1",	"0",	True],
-                    ["Recovery",	"2",	"0",	"0",	"2",	True]],
-
-                2: [["F", "6", "50", "3", "2", True]],
-                3: [["G", "4", "60", "2", "1", False]]
-            },
-            "Isokinetic": {
-                1: [["Rest",	"90",	"0",	"0",	"90",	True],
-                    ["C1",	"120",	"120",	"1",	"9",	True],
-                    ["C2",	"119",	"120",	"1"	,"6",	True],
-                    ["C3",	"120",	"120",	"1",	"4",	True],
-                    ["C4"	,"120",	"120"	,"1",	"3",	True],
-                    ["C5"	,"120", "120",	"1",	"1",	True],
-                    ["Recovery",	"10",	"0",	"0",	"10",	True]],
-
-
-                2: [["Rest",	"90",	"0",	"0",	"90",	True],
-                    ["Contractions",	"24",	"120",	"1",	"1"	,True],
-                    ["Recovery",	"10",	"0",	"0",	"10"	,True]],
-
-                
-                3: [["Rest",	"5",	"0",	"0",	"5",	True],
-                    ["Contractions",	"6",	"120",	"1",	"1"	,True],
-                    ["Recovery",	"10",	"0",	"0",	"10"	,True]],
-            }
-    }
-
-        # Clear existing entries
-        for row_entries in self.entries:
-            for entry in row_entries:
-                entry.delete(0, tk.END)
-        for var in self.vars:
-            var.set(False)
-
-        # Load preset data into the table
-        data = presets.get(self.mode, {}).get(preset_number, [])
-        for i, row in enumerate(data):
-            if i >= len(self.entries):
-                break
-            for j in range(len(row) - 1):  # Exclude checkbox
-                self.entries[i][j].insert(0, row[j])
-            self.vars[i].set(row[-1])
-            self.root.update_idletasks()
+        data = self.library.get(self.mode, preset_number)
+
+        # replace the model, then refill the visible rows and redraw once
+        self.model.load(data)
+        self.table.scroll_to(0)
+        self.root.update_idletasks()
+
+        # compiled plan comes from the on-disk cache (or is built and stored
+        # now), so Start doesn't compile anything
+        self.library.plan(data)
+
+    def save_preset(self):
+        # only filled-in rows; names follow the built-ins' style
+        rows = self.model.filled_rows()
+        if not rows:
+            messagebox.showwarning("Save Preset", "The table is empty.")
+            return
+        name = simpledialog.askstring("Save Preset", "Preset name:", parent=self.root)
+        if not name:
+            return
+        self.library.save(self.mode, name.strip(), rows)
+        self.build_preset_buttons()
 
 
     def build_test_plan(self):
-        frame_rate = 30  # Hz
-        full_signal = []
-        for row_idx, row_entries in enumerate(self.entries):
-            if not self.vars[row_idx].get():
-                continue
-            try:
-                total_time = float(row_entries[1].get())
-                target = float(row_entries[2].get())
-                cont_time = float(row_entries[3].get())
-                rest_time = float(row_entries[4].get())
-            except ValueError:
-                continue
-
-            total_samples = int(total_time * frame_rate)
-            cont_samples = int(cont_time * frame_rate)
-            rest_samples = int(rest_time * frame_rate)
+        from plan_compiler import compile_plan
 
-            signal = [target] * cont_samples + [0] * rest_samples
-            if len(signal) < total_samples:
-                signal += [0] * (total_samples - len(signal))
-            else:
-                signal = signal[:total_samples]
-            full_signal.extend(signal)
-            print("Built signal length:", len(full_signal))
+        # stages come from the model, not the widgets; compiling is cached on
+        # their content, and a loaded preset's plan is already in that cache
+        return compile_plan(self.model.stages())
 
-        return np.array(full_signal)
-    
     def send_spinbox_values_to_plc(self):
-        if self.plc:
-            self.plc.write_spinbox_values(self.spinboxes)
-        else:
-            print("No PLC connected.")
-
+        # unchanged values are skipped, so calling this again at session start is cheap
+        if not self.plc:
+            log.warning("No PLC connected")
+            return None
+        try:
+            values = {label: float(spin.get()) for label, spin in self.spinboxes.items()}
+        except ValueError as e:
+            log.warning("Invalid spinbox value: %s", e)
+            return None
+        try:
+            return self.plc.write_parameters(values)
+        except ParameterConflictError as e:
+            messagebox.showerror("Conflicting Parameters", str(e))
+            return None
+
+
+    def parameter_values(self):
+        # spinbox values as numbers; ones that don't parse are left out
+        values = {}
+        for label, spin in self.spinboxes.items():
+            try:
+                values[label] = float(spin.get())
+            except ValueError:
+                pass
+        return values
 
     def start_live_graph(self):
-        self.send_spinbox_values_to_plc()
+        from graph_view import LiveGraphView
+        from pacing import FramePacer
+        from rigs import RigSession
+        from session_config import build_session_config
 
-        full_signal = self.build_test_plan()  # build signal first
-        full_length = len(full_signal)
+        self.send_spinbox_values_to_plc()
 
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        mode_safe = self.mode.replace(" ", "")
-        os.makedirs("logs", exist_ok=True)
-        self.csv_filename = f"logs/{mode_safe}_{ts}.csv"
-        with open(self.csv_filename, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Index", "Time Stamp", "Position", "Torque", "Velocity", "Torque Error"])
+        # everything the session runs on is fixed here: the hot loops below
+        # never read a spinbox or compare mode strings again
+        config = self.session_config = build_session_config(
+            self.mode, self.build_test_plan(), self.parameter_values()
+        )
+        plan = config.plan
+
+        # samples go to a binary columnar log owned by a writer thread;
+        # the usual CSV is exported from it when the session closes.
+        # acquisition (PLC polling, velocity limits, end of plan) runs on its
+        # own thread, or on the rigs' shared pool
+        if self.rig is not None:
+            self.session = self.rig.new_session(config)
+        else:
+            self.session = RigSession(config, self.stream, self.plc, lock=self.plc_lock)
+        config = self.session_config = self.session.config
+        self.engine = self.session.engine
+        self.csv_filename = self.session.paths["csv"]
+        self.log_filename = self.session.paths["log"]
+        self.meta_filename = self.session.paths["meta"]
 
         
         graph_window = tk.Toplevel(self.root)
-        graph_window.title("Live Graph")
+        graph_window.title(f"Live Graph - {self.rig.name}" if self.rig is not None else "Live Graph")
         graph_window.geometry("1400x900")        # ← set window size: width x height
         graph_window.minsize(800, 600)           # ← optional: enforce a minimum size
 
-        # bigger figure
-        fig, ax = plt.subplots(figsize=(12, 8), dpi=100)  
-        canvas = FigureCanvasTkAgg(fig, master=graph_window)
+        # plan/sampling rate is fixed by the plan; the display rate adapts on its own
+        frame_rate = config.frame_rate
+        display_fps = 30
+        view = LiveGraphView(graph_window, config.mode, plan.signal, frame_rate)
         # make the plot fill the window
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        view.widget.pack(fill=tk.BOTH, expand=True)
 
+        # update() only drains the newest samples from the ring
+        display = config.display
+        seen = 0
 
-        frame_rate = 30
-        window_seconds = 4
-        window_size = int(frame_rate * window_seconds)
-        # time_data = np.linspace(-window_seconds, 0, window_size)
-        time_data = np.linspace(-2,2, window_size)
+        def draw_frame():
+            nonlocal seen
 
-        input_data = np.zeros(window_size)
-        torque_data = np.full(window_size, np.nan)
+            samples, seen = self.engine.ring.since(seen)
 
-               # choose labels based on mode
-        if self.mode in ("Isotonic", "Isokinetic"):
-            planned_lbl = "Planned Position (%)"
-            live_lbl    = "Live Position (%)"
-            ylabel      = "Position (%)"
-        else:
-            planned_lbl = "Planned Input"
-            live_lbl    = "Live Torque (%)"
-            ylabel      = "Torque (%)"
-
-        input_line, = ax.plot(
-            time_data, input_data,
-            label=planned_lbl,
-            color="blue",
-            linewidth=10
-        )
-        torque_line, = ax.plot(
-            time_data, torque_data,
-            label=live_lbl,
-            color="orange",
-            linewidth=10
-        )
-
-        ax.set_ylim(0, 110)
-        ax.set_xlim(-2, 2)
-        ax.set_xlabel("Time (s)")
-        ax.set_ylabel(ylabel)
-        ax.legend()
-        ax.grid(True)
-
-
-        index = 0
-        torque_tag = 'matlabTorque'
-        center_index = window_size // 2
-        self.last_velocity_limit = None
-
-        def update(frame):
-            nonlocal index, center_index
-
-            # Stop when signal ends
-            if index >= full_length:
-                if self.ani:
-                    self.ani.event_source.stop()
-                if self.plc:
-                    self.plc.disable_test_mode()
-
-
-                if self.log_buffer:
-                    with open(self.csv_filename, "a", newline="") as f:
-                        writer = csv.writer(f)
-                        writer.writerows(self.log_buffer)
-                    self.log_buffer.clear()
-
-                return [input_line, torque_line]
-
-            # Slide window of planned input
-            input_data[:-1] = input_data[1:]
-            input_data[-1] = full_signal[index]
+            # Stop when the engine has played the whole plan
+            if not samples and self.engine.finished.is_set():
+                self.finish_session()
+                return False
 
-            # Slide window of live data up to center
-            torque_data[:center_index] = torque_data[1:center_index+1]
+            if samples:
+                # % of the mode's reference parameter as it was at start, or raw
+                view.push(display(samples))
 
-            if self.mode == "Isokinetic":
-                next_vel = full_signal[index]
-                is_last = (index == full_length - 1)
-                # only write when stepping into a non-zero speed,
-                # or when you're at the very end and need to drop to zero
-                if (next_vel > 0 and next_vel != self.last_velocity_limit) or (is_last and next_vel == 0):
-                    self.plc.write('matlabVelocityLimit', int(next_vel))
-                    self.last_velocity_limit = next_vel
+                # Update plot lines
+                view.show(samples[-1][1])
 
-            if self.mode in ("Isotonic", "Isokinetic"):
-                tag = 'matlabPosition'
-            else:
-                tag = 'matlabTorque'
-
-            # # Read raw PLC value
-            # try:
-            #     if self.plc:
-            #         if self.mode in ("Isotonic", "Isokinetic"):
-            #             tag = 'matlabPosition'
-            #         else:
-            #             tag = 'matlabTorque'
-            #         result = self.plc.read(tag)
-            #         raw_val = float(result.value) if result and result.value is not None else 0
-            #     else:
-            #         raw_val = 0
-            # except Exception as e:
-            #     print(f"PLC Read Error: {e}")
-            #     raw_val = 0
-
-
-                # ———————— SINGLE-LOCK READ & LOG ————————
-            with self.plc_lock:
-                # 1) live tag for plotting
-                result  = self.plc.read(tag)
-                raw_val = float(result.value or 0)
-
-                # 2) check/reset DataCacheMatlab
-                data_matrix = []
-                flag = self.plc.read("NewDataFlag").value
-                if flag == 1:
-                    for r in range(6):
-                        row = [self.plc.read(f"DataCacheMatlab[{r},{c}]").value or 0 for c in range(10)]
-                        data_matrix.append(row)
-                    self.plc.write("NewDataFlag", 0)
-
-            # 3) append any rows to CSV immediately
-            # write one CSV row per sample (column)
-            for c in range(10):
-                pos    = data_matrix[0][c]
-                torque = data_matrix[1][c]
-                vel    = data_matrix[2][c]
-                terr   = data_matrix[3][c]
-                self.log_buffer.append([
-                    float(self.csv_index), ts, pos, torque, vel, terr
-                ])
-                self.csv_index += 1
-
-            # every flush_interval frames, dump to disk in one shot
-            self.frame_counter += 1
-            if self.frame_counter >= self.flush_interval:
-                with open(self.csv_filename, "a", newline="") as f:
-                    writer = csv.writer(f)
-                    writer.writerows(self.log_buffer)
-                self.log_buffer.clear()
-                self.frame_counter = 0
-# ————————————————————————————————————————
-
-
-            # Choose denominator spinbox key
-            if self.mode in ("Isotonic", "Isokinetic"):
-                key = "Range of Motion (deg)"
-            elif self.mode == "Isometric":
-                key = "Torque Target (Nm)"
-            else:
-                key = None
-
-            # Compute percentage or raw
-            if key and key in self.spinboxes:
-                denom = float(self.spinboxes[key].get()) or 1
-                scaled = 100 * raw_val / denom
-            else:
-                scaled = raw_val
-
-            # Insert into center of window
-            torque_data[center_index] = scaled
-
-            # Update plot lines
-            input_line.set_ydata(input_data)
-            torque_line.set_ydata(torque_data)
+            pacer = self.pacer
+            view.set_status(
+                f"display {pacer.fps:.0f}/{display_fps} fps   late {pacer.late}   "
+                f"dropped {pacer.dropped}   late samples {self.engine.late_ticks}"
+            )
+            view.update()
+            return True
 
-            index += 1
-            return [input_line, torque_line]
+        def on_graph_close():
+            self.pacer.stop()
+            self.engine.stop()
+            self.finish_session()
+            view.close()
+            graph_window.destroy()
 
+        graph_window.protocol("WM_DELETE_WINDOW", on_graph_close)
 
-            # input_line.set_ydata(input_data)
-            # torque_line.set_ydata(torque_data)
+        self.session.start()
+        self.pacer = FramePacer(graph_window, draw_frame, target_fps=display_fps)
+        view.draw()
+        self.pacer.start()
 
-            # index += 1
-            # return [input_line, torque_line]
-
-        self.ani = animation.FuncAnimation(
-            fig,
-            update,
-            interval=1000 / frame_rate,
-            blit=True,
-            cache_frame_data=False,
-        )
-        canvas.draw()
 
 
+    def finish_session(self):
+        if self.session is None or not self.session.running:
+            return
+        # how far the run drifted from the plan
+        summary = self.session.finish(wait=False)
+        if summary["error"]:
+            messagebox.showerror("Session Stopped",
+                                 f"Acquisition stopped early, test mode was disabled:\n{summary['error']}")
+        timing, batches = summary["timing"], summary["batches"]
+        if batches["missed_batches"] or batches["duplicate_batches"]:
+            log.warning("DataCacheMatlab: %d batches logged, %d missed, %d read twice",
+                        batches["batches"], batches["missed_batches"], batches["duplicate_batches"])
+        log.info("Session timing: planned %.1fs, end drift %.1f ms, skipped %d, late %d",
+                 timing['planned_duration_s'], timing.get('end_drift_ms', 0),
+                 timing['skipped_samples'], timing['late_samples'])
 
 
 if __name__ == "__main__":
     root = tk.Tk()
     root.title("Input Table")
     root.geometry("1200x800")
-    app = InputTable(root, plc=PLCInterface(...), lock = plc_lock)
+    app = InputTable(root, plc=PLCInterface(...))
     root.mainloop()
@@ -0,0 +1,405 @@
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from plc_interface import CACHE_COLS, CACHE_ROWS
+from session_log import DATA_ROWS
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+# Live DataCacheMatlab batches for programs outside the app (MATLAB, Python
+# notebooks), published from the acquisition thread as each batch arrives:
+#
+#   TCP, localhost only: a stream of frames
+#       uint32 body length | uint8 kind | body          (little-endian)
+#     kind 0 (JSON): {"type": "hello", ...format...} on connect, then
+#       {"type": "session_start", ...} / {"type": "session_end", ...}
+#     kind 1 (batch): uint64 seq | float64 timestamp | uint16 rows | uint16 cols
+#       | rows*cols float32, row-major (rows as in DataCacheMatlab)
+#
+#   Shared memory ring (same host, no socket): see SharedRing
+#
+# seq counts batches from 1 for the publisher's lifetime, so a gap means the
+# consumer missed batches. publish() never blocks: every TCP subscriber has
+# a bounded queue drained by its own sender thread, and a subscriber that
+# falls behind loses its oldest batches instead of holding up acquisition.
+#
+#   for seq, timestamp, batch in iter_batches(port=47800):
+#       torque = batch[1]
+#
+# MATLAB: c = tcpclient("127.0.0.1", 47800); read 5 bytes, typecast the first
+# four to uint32 for the body length, then read the body.
+
+STREAM_PORT = 47800
+FRAME_HEAD = struct.Struct("<IB")
+BATCH_HEAD = struct.Struct("<QdHH")
+KIND_JSON = 0
+KIND_BATCH = 1
+ROW_NAMES = {row: name for name, row in DATA_ROWS}
+
+
+def _frame(kind, body):
+    return FRAME_HEAD.pack(len(body), kind) + body
+
+
+def _json_frame(message):
+    return _frame(KIND_JSON, json.dumps(message).encode())
+
+
+def _batch_frame(seq, timestamp, batch):
+    rows, cols = batch.shape
+    return _frame(KIND_BATCH, BATCH_HEAD.pack(seq, timestamp, rows, cols) + batch.tobytes())
+
+
+def format_description():
+    return {
+        "format": "ergometer-batches",
+        "version": 1,
+        "rows": CACHE_ROWS,
+        "cols": CACHE_COLS,
+        "row_names": [ROW_NAMES.get(row) for row in range(CACHE_ROWS)],
+        "dtype": "float32",
+    }
+
+
+class _Subscriber:
+    def __init__(self, sock, addr, max_queue):
+        self.sock = sock
+        self.addr = addr
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, frame):
+        # never blocks: when full, the oldest queued frame makes room
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    TELEMETRY.count("stream.dropped")
+                except queue.Empty:
+                    pass
+
+    def run(self, on_exit):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                self.sock.sendall(frame)
+                self.sent += 1
+        except OSError as e:
+            log.info("Stream subscriber %s:%d gone: %s", *self.addr, e)
+        finally:
+            self.closed = True
+            self.sock.close()
+            on_exit(self)
+
+
+class SharedRing:
+    # Batches in a shared memory block, for readers on the same host:
+    #
+    #   header (64 bytes): magic, version, slots, rows, cols, slot bytes, write seq,
+    #                      owner pid
+    #   slot i: uint64 seq | float64 timestamp | rows*cols float32
+    #
+    # Batch n goes to slot (n - 1) % slots. The writer clears a slot's seq
+    # before filling it and sets it after, then advances the header's write
+    # seq; a reader re-checks the slot seq after copying, so it never returns
+    # a slot that was being overwritten.
+    MAGIC = b"ERGORING"
+    HEADER = struct.Struct("<8sIIIIIQ")
+    OWNER = struct.Struct("<I")  # right after HEADER
+    HEADER_SIZE = 64
+    SLOT_HEAD = struct.Struct("<Qd")
+
+    def __init__(self, name=None, slots=4096, rows=CACHE_ROWS, cols=CACHE_COLS, create=True):
+        self.rows, self.cols = rows, cols
+        if create:
+            self.slot_size = self.SLOT_HEAD.size + rows * cols * 4
+            self.slots = slots
+            size = self.HEADER_SIZE + slots * self.slot_size
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # only a ring whose owner is gone (crash, kill -9) is reclaimed;
+                # one a running publisher owns is left alone
+                owner = self._orphan_owner(name)
+                log.warning("Replacing shared memory block %s left by process %d", name, owner)
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._write_header(0)
+            self.OWNER.pack_into(self.shm.buf, self.HEADER.size, os.getpid())
+        else:
+            self.shm = _attach(name)
+            magic, _, self.slots, self.rows, self.cols, self.slot_size, _ = \
+                self.HEADER.unpack_from(self.shm.buf, 0)
+            if magic != self.MAGIC:
+                raise ValueError(f"{name} is not an ergometer batch ring")
+        self.name = self.shm.name
+        self.owner = create
+
+    @classmethod
+    def attach(cls, name):
+        return cls(name, create=False)
+
+    @classmethod
+    def _orphan_owner(cls, name):
+        # -> pid of the dead process that created ring `name`; FileExistsError
+        #    when it is still running or the block isn't provably an orphan
+        shm = _attach(name)
+        try:
+            magic = cls.HEADER.unpack_from(shm.buf, 0)[0]
+            (owner,) = cls.OWNER.unpack_from(shm.buf, cls.HEADER.size)
+        finally:
+            shm.close()
+        if magic != cls.MAGIC:
+            raise FileExistsError(f"shared memory block {name} exists and is not an ergometer batch ring")
+        if not owner or _pid_alive(owner):
+            raise FileExistsError(
+                f"shared memory block {name} is in use (owner pid {owner or 'unknown'}); "
+                "another publisher runs this rig, give this one a different name"
+            )
+        return owner
+
+    def _write_header(self, seq):
+        self.HEADER.pack_into(self.shm.buf, 0, self.MAGIC, 1, self.slots, self.rows,
+                              self.cols, self.slot_size, seq)
+
+    @property
+    def write_seq(self):
+        return struct.unpack_from("<Q", self.shm.buf, self.HEADER.size - 8)[0]
+
+    def _slot(self, seq):
+        return self.HEADER_SIZE + (seq - 1) % self.slots * self.slot_size
+
+    def write(self, seq, timestamp, batch):
+        offset = self._slot(seq)
+        buf = self.shm.buf
+        struct.pack_into("<Q", buf, offset, 0)
+        data = offset + self.SLOT_HEAD.size
+        buf[data:data + batch.nbytes] = batch.tobytes()
+        self.SLOT_HEAD.pack_into(buf, offset, seq, timestamp)
+        struct.pack_into("<Q", buf, self.HEADER.size - 8, seq)
+
+    def read(self, after=0, limit=None):
+        # -> ([(seq, timestamp, batch)], batches lost) for batches after
+        #    `after`; lost counts ones already overwritten
+        head = self.write_seq
+        first = max(after + 1, head - self.slots + 1, 1)
+        lost = first - after - 1 if after else 0
+        if limit:
+            first = max(first, head - limit + 1)
+        out = []
+        buf = self.shm.buf
+        n = self.rows * self.cols
+        for seq in range(first, head + 1):
+            offset = self._slot(seq)
+            slot_seq, timestamp = self.SLOT_HEAD.unpack_from(buf, offset)
+            batch = np.frombuffer(buf, dtype="<f4", count=n,
+                                  offset=offset + self.SLOT_HEAD.size).reshape(self.rows, self.cols).copy()
+            if slot_seq != seq or struct.unpack_from("<Q", buf, offset)[0] != seq:
+                lost += 1  # overwritten while we read it
+                continue
+            out.append((seq, timestamp, batch))
+        return out, lost
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # named blocks vanish with their last handle there, so one that
+        # exists has a live owner (and os.kill would terminate it)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _attach(name):
+    # readers must not unlink the block when they exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class LivePublisher:
+    # One per rig, for as long as the app runs, so subscribers stay connected
+    # across sessions. port=0 picks a free port (see .port); shm_name=None
+    # skips the shared memory ring, "" gives it a generated name.
+    def __init__(self, port=STREAM_PORT, host="127.0.0.1", shm_name=None, shm_slots=4096,
+                 max_queue=256):
+        self.host = host
+        self.requested_port = port
+        self.port = None
+        self.shm_name = shm_name
+        self.shm_slots = shm_slots
+        self.max_queue = max_queue
+        self.ring = None
+        self.seq = 0
+        self.session = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._stop = threading.Event()
+
+    def start(self):
+        # OSError when the port is taken or the ring can't be created; nothing
+        # is left open then
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name == "nt":
+                # SO_REUSEADDR there lets a second bind share a listening port
+                server.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+            else:
+                # POSIX: restart right away over TIME_WAIT, still fails on a live listener
+                server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.requested_port))
+            server.listen()
+            server.settimeout(0.5)
+            if self.shm_name is not None:
+                self.ring = SharedRing(self.shm_name or None, slots=self.shm_slots)
+        except OSError:
+            server.close()
+            raise
+        self._server = server
+        self.port = server.getsockname()[1]
+        threading.Thread(target=self._accept, name=f"stream-{self.port}", daemon=True).start()
+        log.info("Streaming batches on %s:%d%s", self.host, self.port,
+                 f", shared memory {self.ring.name}" if self.ring else "")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.close()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for sub in subscribers:
+            try:
+                sub.sock.shutdown(socket.SHUT_RDWR)  # ends a sender stuck in sendall
+            except OSError:
+                pass
+            sub.offer(None)
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                sock, addr = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sub = _Subscriber(sock, addr, self.max_queue)
+            sub.offer(_json_frame(dict(format_description(), type="hello", seq=self.seq,
+                                       shm=self.ring.name if self.ring else None)))
+            if self.session is not None:
+                sub.offer(_json_frame(self.session))
+            with self._lock:
+                self._subscribers.append(sub)
+            threading.Thread(target=sub.run, args=(self._remove,), name=f"stream-{addr[1]}",
+                             daemon=True).start()
+            log.info("Stream subscriber %s:%d connected", *addr)
+
+    def _remove(self, sub):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def _broadcast(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.offer(frame)
+
+    # --- called by the session (acquisition thread for publish) ----------
+
+    def begin(self, **session):
+        self.session = dict(session, type="session_start", time=time.time())
+        self._broadcast(_json_frame(self.session))
+
+    def end(self, **summary):
+        self.session = None
+        self._broadcast(_json_frame(dict(summary, type="session_end", time=time.time(), seq=self.seq)))
+
+    def publish(self, timestamp, data_matrix):
+        self.seq += 1
+        batch = np.asarray(data_matrix, dtype="<f4")
+        if self.ring is not None:
+            self.ring.write(self.seq, timestamp, batch)
+        if self._subscribers:
+            self._broadcast(_batch_frame(self.seq, timestamp, batch))
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "port": self.port,
+            "shm": self.ring.name if self.ring else None,
+            "batches": self.seq,
+            "subscribers": [{"addr": f"{s.addr[0]}:{s.addr[1]}", "sent": s.sent, "dropped": s.dropped,
+                             "queued": s.queue.qsize()} for s in subscribers],
+        }
+
+
+def _recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("publisher closed the stream")
+        data += chunk
+    return bytes(data)
+
+
+def iter_frames(host="127.0.0.1", port=STREAM_PORT):
+    # -> ("json", dict) and ("batch", (seq, timestamp, rows x cols array)) as they arrive
+    with socket.create_connection((host, port)) as sock:
+        while True:
+            length, kind = FRAME_HEAD.unpack(_recv_exact(sock, FRAME_HEAD.size))
+            body = _recv_exact(sock, length)
+            if kind == KIND_JSON:
+                yield "json", json.loads(body)
+            elif kind == KIND_BATCH:
+                seq, timestamp, rows, cols = BATCH_HEAD.unpack_from(body)
+                batch = np.frombuffer(body, dtype="<f4", offset=BATCH_HEAD.size).reshape(rows, cols)
+                yield "batch", (seq, timestamp, batch)
+
+
+def iter_batches(host="127.0.0.1", port=STREAM_PORT):
+    # -> (seq, timestamp, batch) for every batch received, skipping messages
+    for kind, item in iter_frames(host, port):
+        if kind == "batch":
+            yield item
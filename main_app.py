@@ -1,7 +1,13 @@
+import logging
+import os
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import filedialog, messagebox
 from input_table_module import InputTable 
-from plc_interface import PLCInterface
+from rigs import RigPool, load_rig_specs
+from plc_interface import TEST_MODES
+from telemetry import TELEMETRY, configure_logging
+
+log = logging.getLogger(__name__)
 
 
 class ModeSwitcherApp:
@@ -10,9 +16,17 @@ class ModeSwitcherApp:
         self.root.title("Ergo UI")
         self.root.geometry("1450x600")
 
-        #initializing the plc connection
-        self.plc = PLCInterface('192.168.1.10')
-        self.plc.connect()
+        #initializing the plc connections: one per rig (see rigs.load_rig_specs;
+        #ERGO_SIMULATOR runs a single simulated rig). Each connects in the
+        #background, reconnects on its own, and keeps separate control
+        #(self.plc) and streaming sessions
+        # ERGO_STREAM_PORT=47800 publishes live batches for MATLAB/notebooks
+        # (see live_stream); ERGO_STREAM_SHM=1 adds a shared memory ring
+        stream_port = os.environ.get("ERGO_STREAM_PORT")
+        self.pool = RigPool(load_rig_specs(), stream_port=int(stream_port) if stream_port else None,
+                            shm=bool(os.environ.get("ERGO_STREAM_SHM")))
+        self.rig_views = {}  # rig name -> (frame, InputTable)
+        self.select_rig(self.pool.rigs[0].name)
 
         # Top frame
         self.top_frame = tk.Frame(root)
@@ -30,7 +44,15 @@ class ModeSwitcherApp:
         self.init_live_graph_button()   # Add this for Start Live Grap
 
 
-        self.active_frame = None
+        self.pool.start()
+        self.poll_link_status()
+
+    def poll_link_status(self):
+        # the manager thread only updates state; Tk reads it here
+        state = self.link.state
+        color = {"connected": "darkgreen", "degraded": "orange"}.get(state, "red")
+        self.link_label.config(text=self.link.status_text(), fg=color)
+        self.root.after(500, self.poll_link_status)
 
     def init_mode_buttons(self):
         self.add_mode_button("Isometric", "#007FFF", lambda: self.show_input_table("Isometric"))
@@ -88,34 +110,28 @@ class ModeSwitcherApp:
 
 
     def pretension_action(self):
-        if self.plc:
-            try:
-                # Step 1: Get value from spinbox
-                value = float(self.pretension_spinbox.get())
-
-                # Step 2: Write value to PLC
-                success = self.plc.write('matlabPretension', value)
-                if not success:
-                    print("❌ Failed to write pretension value to PLC.")
-                    return
-
-
-                # Step 3: Enable pretension
-                success = self.plc.start_pretension()
-
-                if success:
-                    # print(f"✅ Pretension {value} Nm routine started.") #test to check the value of the pretension being written
-                    self.blink_count = 0
-                    self.blinking = True
-                    self.blink_light()
-                else:
-                    print("❌ Pretension start failed.")
-            except ValueError:
-                print("⚠️ Invalid pretension value in spinbox.")
-            except Exception as e:
-                print(f"❌ Error during pretension action: {e}")
-        else:
-            print("❌ No PLC connected.")
+        try:
+            # Step 1: Get value from spinbox
+            value = float(self.pretension_spinbox.get())
+        except ValueError:
+            log.warning("Invalid pretension value in spinbox")
+            return
+
+        # Steps 2-3: write the value and enable pretension off the Tk thread
+        async def pretension():
+            await self.plc_async.write('matlabPretension', value)
+            await self.plc_async.start_pretension()
+
+        self.plc_async.run_in_tk(
+            self.root, pretension(),
+            on_result=lambda _: self.start_blinking(),
+            on_error=lambda e: log.error("Pretension start failed: %s", e),
+        )
+
+    def start_blinking(self):
+        self.blink_count = 0
+        self.blinking = True
+        self.blink_light()
 
     def blink_light(self):
         if not self.blinking:
@@ -132,6 +148,19 @@ class ModeSwitcherApp:
             self.light_canvas.itemconfig(self.light_id, fill="white")
             self.blinking = False
 
+    def select_rig(self, name):
+        # the controls act on one rig at a time; other rigs' tables (and
+        # their running sessions) stay alive while hidden
+        self.rig = self.pool.rig(name)
+        self.link = self.rig.link
+        self.plc = self.rig.plc
+        self.plc_async = self.rig.plc_async
+        for frame, _ in self.rig_views.values():
+            frame.pack_forget()
+        self.active_frame, self.active_table = self.rig_views.get(name, (None, None))
+        if self.active_frame:
+            self.active_frame.pack(fill="both", expand=True)
+
     def show_input_table(self, mode):
         if self.active_frame:
             self.active_frame.destroy()
@@ -139,11 +168,16 @@ class ModeSwitcherApp:
         self.active_frame = tk.Frame(self.main_frame)
         self.active_frame.pack(fill="both", expand=True)
 
-        self.active_table = InputTable(self.active_frame, mode=mode, plc=self.plc)
+        self.active_table = InputTable(self.active_frame, mode=mode, rig=self.rig)
+        self.rig_views[self.rig.name] = (self.active_frame, self.active_table)
+
+    def show_dashboard(self):
+        from rig_dashboard import RigDashboard
+        RigDashboard(self.root, self.pool)
 
     def on_closing(self):
-        if self.plc:
-            self.plc.disconnect()
+        TELEMETRY.disable()
+        self.pool.stop()
         self.root.destroy()
 
 
@@ -161,41 +195,84 @@ class ModeSwitcherApp:
         self.countdown_label = tk.Label(self.top_frame, text=f"Countdown: {self.countdown_seconds}", font=("Arial", 12), fg="red")
         self.countdown_label.pack(side="right", padx=(0, 10))
 
-    def start_live_graph_clicked(self):
-
-        # Determine test mode
-       mode_map = {"Isometric": 1, "Isotonic": 2, "Isokinetic": 3}
-       mode = self.active_table.mode if self.active_table else None
-       mode_value = mode_map.get(mode)
-
-       if self.plc and mode_value:
-        self.plc.enable_test_mode(mode_value)
+        self.link_label = tk.Label(self.top_frame, text="PLC: connecting", font=("Arial", 10), fg="red")
+        self.link_label.pack(side="right", padx=(0, 10))
 
+        self.replay_button = tk.Button(
+            self.top_frame,
+            text="Replay Session",
+            font=("Georgia", 11),
+            padx=8, pady=5,
+            command=self.replay_session_clicked
+        )
+        self.replay_button.pack(side="right", padx=5)
+
+        if len(self.pool) > 1:
+            self.dashboard_button = tk.Button(
+                self.top_frame, text="Rigs", font=("Georgia", 11), padx=8, pady=5,
+                command=self.show_dashboard
+            )
+            self.dashboard_button.pack(side="right", padx=5)
+            self.rig_var = tk.StringVar(value=self.rig.name)
+            tk.OptionMenu(self.top_frame, self.rig_var, *(rig.name for rig in self.pool),
+                          command=self.select_rig).pack(side="right", padx=5)
+
+    def replay_session_clicked(self):
+        path = filedialog.askopenfilename(
+            title="Replay session", initialdir="logs",
+            filetypes=[("Session logs", "*.ergolog"), ("All files", "*")],
+        )
+        if not path:
+            return
+        from replay import SessionReplay  # pulls in matplotlib
+        try:
+            SessionReplay(self.root, path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Replay", f"Could not open {path}:\n{e}")
 
-        if not self.active_table:
+    def start_live_graph_clicked(self):
+        # the rig and table are fixed at the click, so switching rigs during
+        # the countdown can't change where the session starts
+        rig, table = self.rig, self.active_table
+        if not table:
             messagebox.showwarning("No Mode Selected", "Please select a mode to load the input table first.")
             return
+        if rig.session is not None and rig.session.running:
+            messagebox.showerror("Start Live Graph", f"{rig.name} already has a session running.")
+            return
+
+        mode_value = TEST_MODES.get(table.mode)
+        if rig.plc.connected and mode_value:
+            rig.plc.enable_test_mode(mode_value)
 
-   
-        self.active_table.send_spinbox_values_to_plc()
+        table.send_spinbox_values_to_plc()
 
         self.live_graph_button.config(state="disabled")
         self.countdown_seconds = 5
-        self.update_countdown()
+        self.update_countdown(rig, table)
 
 
-    def update_countdown(self):
+    def update_countdown(self, rig, table):
         if self.countdown_seconds > 0:
             self.countdown_label.config(text=f"Countdown: {self.countdown_seconds}")
             self.countdown_seconds -= 1
-            self.root.after(1000, self.update_countdown)
+            self.root.after(1000, self.update_countdown, rig, table)
         else:
             self.countdown_label.config(text=f"Countdown: 5")  # reset to 5 after finishing
             self.live_graph_button.config(state="normal")
-            self.active_table.start_live_graph()
+            try:
+                table.start_live_graph()
+            except RuntimeError as e:
+                # Rig.new_session: that rig already has a session running
+                rig.plc.disable_test_mode()
+                messagebox.showerror("Start Live Graph", str(e))
 
 
 if __name__ == "__main__":
+    configure_logging()
+    if os.environ.get("ERGO_TELEMETRY"):
+        # e.g. ERGO_TELEMETRY=logs/telemetry.json: histograms/counters rewritten every 5 s
+        TELEMETRY.enable(snapshot_path=os.environ["ERGO_TELEMETRY"])
     root = tk.Tk()
     app = ModeSwitcherApp(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)  # handle window close to clean up PLC
@@ -0,0 +1,109 @@
+import time
+
+from telemetry import TELEMETRY
+
+
+class FramePacer:
+    # Schedules redraws with Tk's after() at an adaptive rate. Plan time and
+    # PLC sampling run on the acquisition engine's clock, so a slow redraw only
+    # lowers the display rate; it never stretches the protocol.
+    #   draw() renders one frame and returns False once the session is over
+    def __init__(self, widget, draw, target_fps=30, min_fps=5, headroom=0.75):
+        self.widget = widget
+        self.draw = draw
+        self.target_interval = 1.0 / target_fps
+        self.max_interval = 1.0 / min_fps
+        self.headroom = headroom  # share of the frame interval drawing may use
+
+        self.interval = self.target_interval
+        self.draw_time = 0.0  # smoothed seconds per draw
+        self.frames = 0
+        self.late = 0  # drawn more than half an interval after their deadline
+        self.dropped = 0  # frames the target rate asked for that were never drawn
+        self._start = None
+        self._deadline = None
+        self._after_id = None
+
+    @property
+    def fps(self):
+        return 1.0 / self.interval
+
+    def start(self):
+        self._start = self._deadline = time.monotonic()
+        self._after_id = self.widget.after(0, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except Exception:
+                pass  # widget already destroyed
+            self._after_id = None
+
+    def _tick(self):
+        self._after_id = None
+        now = time.monotonic()
+        if now - self._deadline > self.interval / 2:
+            self.late += 1
+
+        t0 = time.perf_counter()
+        keep_going = self.draw()
+        elapsed = time.perf_counter() - t0
+        if TELEMETRY.enabled:
+            TELEMETRY.observe("frame.draw", elapsed)
+
+        self.frames += 1
+        self.draw_time = elapsed if self.frames == 1 else 0.8 * self.draw_time + 0.2 * elapsed
+        expected = int((time.monotonic() - self._start) / self.target_interval) + 1
+        dropped = max(0, expected - self.frames)
+        if dropped > self.dropped:
+            TELEMETRY.count("frame.dropped", dropped - self.dropped)
+        self.dropped = dropped
+        self._adapt()
+
+        if keep_going is False:
+            return
+        now = time.monotonic()
+        self._deadline = max(self._deadline + self.interval, now)
+        delay_ms = max(1, int((self._deadline - now) * 1000))
+        self._after_id = self.widget.after(delay_ms, self._tick)
+
+    def _adapt(self):
+        budget = self.interval * self.headroom
+        if self.draw_time > budget:
+            self.interval = min(self.max_interval, self.interval * 1.25)
+        elif self.draw_time < budget / 2 and self.interval > self.target_interval:
+            self.interval = max(self.target_interval, self.interval / 1.1)
+
+
+class BlitManager:
+    # Redraws only the animated artists over a cached background. The
+    # background is re-captured on every full canvas draw (first show, resize).
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = list(artists)
+        for artist in self.artists:
+            artist.set_animated(True)
+        self._background = None
+        self._cid = canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            figure.draw_artist(artist)
+
+    def update(self):
+        if self._background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self._cid)
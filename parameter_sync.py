@@ -0,0 +1,93 @@
+import logging
+import math
+
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+# spinbox label -> PLC tag; two labels drive matlabTorqueSetpoint
+SPINBOX_TAGS = {
+    "Pretension (Nm)": "matlabPretension",
+    "Torque Target (Nm)": "matlabTorqueSetpoint",
+    "Min Torque Threshold (Nm)": "matlabTorqueSetpoint",
+    "Range of Motion (deg)": "matlabRange",
+}
+
+
+class ParameterConflictError(ValueError):
+    # two labels asked for different values on the same tag in one sync
+    def __init__(self, tag, requested):
+        self.tag = tag
+        self.requested = requested  # {label: value}
+        super().__init__(f"conflicting values for {tag}: {requested}")
+
+
+def _same(a, b):
+    # tags are REALs, so a read-back is only float32-exact
+    return a is not None and b is not None and math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-6)
+
+
+class ParameterSync:
+    # Remembers what was last written to (and read back from) the controller
+    # and only sends values that changed: one multi-tag write, one multi-tag
+    # read-back. The record is tied to the driver session it was written on,
+    # so a reconnect (new session, maybe a restarted PLC) starts over.
+    def __init__(self, plc, tags=SPINBOX_TAGS):
+        self.plc = plc
+        self.tags = tags
+        self.written = {}  # tag -> verified value
+        self._session = None
+
+    def resolve(self, values):
+        # {label: value} -> {tag: value}; unknown labels are ignored
+        resolved, sources = {}, {}
+        for label, value in values.items():
+            tag = self.tags.get(label)
+            if tag is None:
+                continue
+            value = float(value)
+            if tag in resolved and not _same(resolved[tag], value):
+                raise ParameterConflictError(tag, {sources[tag]: resolved[tag], label: value})
+            resolved[tag] = value
+            sources[tag] = label
+        return resolved
+
+    def changes(self, values):
+        resolved = self.resolve(values)
+        return {tag: v for tag, v in resolved.items() if not _same(self.written.get(tag), v)}
+
+    def invalidate(self):
+        self.written.clear()
+
+    def sync(self, values):
+        # -> {tag: value} actually written and verified ({} when nothing changed),
+        #    None when the write or read-back failed
+        with self.plc.lock:
+            if self.plc.plc is not self._session:
+                self.invalidate()
+                self._session = self.plc.plc
+
+            pending = self.changes(values)
+            if not pending:
+                return {}
+            if not self.plc.write_many(*pending.items()):
+                log.error("Failed to write parameters %s", pending)
+                return None
+
+            readback = self.plc.read_many(*pending)
+            if not readback:
+                log.warning("Wrote %s, but the read-back failed", pending)
+                return None
+            mismatched = {}
+            for (tag, value), actual in zip(pending.items(), readback):
+                if _same(actual, value):
+                    self.written[tag] = value
+                else:
+                    self.written.pop(tag, None)
+                    mismatched[tag] = (value, actual)
+            if mismatched:
+                TELEMETRY.count("plc.write_verify_failed", len(mismatched))
+                log.warning("Parameter verification failed (wrote, read): %s", mismatched)
+                return None
+            log.info("Parameters written: %s", pending)
+            return pending
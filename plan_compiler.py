@@ -0,0 +1,170 @@
+from collections import OrderedDict, namedtuple
+import hashlib
+import json
+import os
+
+import numpy as np
+
+FRAME_RATE = 30  # plan samples per second
+# bump when compile_plan's output for the same stages changes, so old
+# on-disk plans (see compile_plan's cache_dir) are not reused
+COMPILER_VERSION = 1
+PLAN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ergometer", "plan_cache")
+
+# One row of the stage table. Times are in seconds.
+Stage = namedtuple("Stage", "name total_time target cont_time rest_time enabled")
+
+_SEGMENT_CACHE_SIZE = 256
+_PLAN_CACHE_SIZE = 32
+_segments = OrderedDict()
+_plans = OrderedDict()
+
+
+class CompiledPlan:
+    # signal: read-only float array, one target value per plan sample
+    # stages: the enabled stages that made it into the signal
+    # stage_starts: first sample of each of those stages (plus the total length)
+    # velocity_schedule: (sample indices, values) of the Isokinetic
+    #   matlabVelocityLimit writes, see velocity_schedule()
+    def __init__(self, signal, stages, stage_starts, frame_rate, schedule=None):
+        self.signal = signal
+        self.stages = stages
+        self.stage_starts = stage_starts
+        self.frame_rate = frame_rate
+        self.velocity_schedule = schedule or velocity_schedule(signal)
+
+    def __len__(self):
+        return len(self.signal)
+
+    @property
+    def duration(self):
+        return len(self.signal) / self.frame_rate
+
+
+def velocity_schedule(signal):
+    # Change points of the speed limit: a write whenever the plan steps into a
+    # non-zero speed different from the last one written (rests in between
+    # don't count), and a final write of 0 if the plan ends at rest.
+    moving = np.flatnonzero(signal > 0)
+    speeds = signal[moving]
+    changed = np.ones(len(speeds), dtype=bool)
+    changed[1:] = speeds[1:] != speeds[:-1]
+    indices = moving[changed]
+    values = speeds[changed].astype(np.int64)
+    if len(signal) and signal[-1] == 0:
+        indices = np.append(indices, len(signal) - 1)
+        values = np.append(values, 0)
+    indices.flags.writeable = False
+    values.flags.writeable = False
+    return indices, values
+
+
+def stages_from_rows(rows):
+    # table/preset rows [name, total, target, cont, rest, enabled] -> Stages;
+    # rows that don't parse are skipped, as the table always did
+    stages = []
+    for row in rows:
+        try:
+            stages.append(Stage(
+                str(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4]), bool(row[5])
+            ))
+        except (TypeError, ValueError, IndexError):
+            continue
+    return stages
+
+
+def _lru_get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _lru_put(cache, key, value, size):
+    cache[key] = value
+    if len(cache) > size:
+        cache.popitem(last=False)
+
+
+def _segment(target, total_samples, cont_samples):
+    # contraction at the target, then zeros; the rest time only ever padded
+    # the stage out to its total time, so it doesn't change the samples
+    key = (target, total_samples, cont_samples)
+    seg = _lru_get(_segments, key)
+    if seg is None:
+        seg = np.zeros(total_samples)
+        seg[:min(cont_samples, total_samples)] = target
+        seg.flags.writeable = False
+        _lru_put(_segments, key, seg, _SEGMENT_CACHE_SIZE)
+    return seg
+
+
+def plan_key(stages, frame_rate=FRAME_RATE):
+    # content hash of the enabled stages, used to name on-disk plans
+    stages = [list(Stage(*s)) for s in stages if s[-1]]
+    text = json.dumps([COMPILER_VERSION, frame_rate, stages])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def compile_plan(stages, frame_rate=FRAME_RATE, cache_dir=None):
+    # memoized on stage content: restarting a session reuses the plan and
+    # editing one row only rebuilds that row's segment. With cache_dir the
+    # plan is also kept on disk, so it survives restarts.
+    stages = tuple(Stage(*s) for s in stages if s[-1])
+    key = (stages, frame_rate)
+    plan = _lru_get(_plans, key)
+    if plan is not None:
+        return plan
+
+    path = os.path.join(cache_dir, plan_key(stages, frame_rate) + ".npz") if cache_dir else None
+    plan = _load_plan(path, stages, frame_rate) if path else None
+    if plan is None:
+        plan = _compile(stages, frame_rate)
+        if path:
+            _save_plan(path, plan)
+    _lru_put(_plans, key, plan, _PLAN_CACHE_SIZE)
+    return plan
+
+
+def _compile(stages, frame_rate):
+    # negative times give an empty stage / no contraction, as the table always did
+    segments = [
+        _segment(s.target, max(0, int(s.total_time * frame_rate)), max(0, int(s.cont_time * frame_rate)))
+        for s in stages
+    ]
+    lengths = np.array([len(seg) for seg in segments], dtype=np.int64)
+    stage_starts = np.concatenate(([0], np.cumsum(lengths)))
+    signal = np.concatenate(segments) if segments else np.zeros(0)
+    signal.flags.writeable = False
+    stage_starts.flags.writeable = False
+
+    return CompiledPlan(signal, stages, stage_starts, frame_rate)
+
+
+def _load_plan(path, stages, frame_rate):
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in
+                      ("signal", "stage_starts", "command_indices", "command_values")}
+    except (OSError, ValueError, KeyError):
+        return None  # unreadable or partial file: recompile over it
+    for a in arrays.values():
+        a.flags.writeable = False
+    return CompiledPlan(arrays["signal"], stages, arrays["stage_starts"], frame_rate,
+                        schedule=(arrays["command_indices"], arrays["command_values"]))
+
+
+def _save_plan(path, plan):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    indices, values = plan.velocity_schedule
+    np.savez(tmp, signal=plan.signal, stage_starts=plan.stage_starts,
+             command_indices=indices, command_values=values)
+    os.replace(tmp, path)
+
+
+def clear_cache():
+    _segments.clear()
+    _plans.clear()
@@ -1,133 +1,299 @@
-from pycomm3 import CommError, LogixDriver
+from pycomm3 import CommError, LogixDriver, PycommError
+import logging
+import threading
 import time
 
+from parameter_sync import ParameterConflictError, ParameterSync
+from tag_cache import load_scoped_tags
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
 PLC_IP = '192.168.1.10'
 
+# DataCacheMatlab is a REAL[6,10] block the PLC fills with 10 samples per batch
+CACHE_TAG = 'DataCacheMatlab'
+CACHE_ROWS = 6
+CACHE_COLS = 10
+LIVE_TAGS = ('matlabTorque', 'matlabPosition')
+# matlabTestMode value and the live tag plotted for each test mode
+TEST_MODES = {"Isometric": 1, "Isotonic": 2, "Isokinetic": 3}
+MODE_LIVE_TAGS = {"Isometric": 'matlabTorque', "Isotonic": 'matlabPosition', "Isokinetic": 'matlabPosition'}
+# optional DINT the PLC increments every time it refills the cache; when the
+# program has it, overruns and re-reads show up as gaps/repeats in the count
+BATCH_SEQ_TAG = 'DataCacheSeq'
+
+# every controller tag the app reads or writes (scoped tag discovery, see tag_cache)
+APP_TAGS = (
+    'matlabTorque', 'matlabPosition', 'NewDataFlag', CACHE_TAG,
+    'matlabVelocityLimit', 'matlabTestMode', 'matlabTestingEnabled',
+    'matlabTorqueSetpoint', 'matlabRange', 'matlabPretension', 'matlabPretensionEnable',
+    BATCH_SEQ_TAG,
+)
+
+def cache_matrix(block):
+    # flat DataCacheMatlab{60} read -> CACHE_ROWS lists of CACHE_COLS samples
+    return [
+        [v or 0 for v in block[r * CACHE_COLS:(r + 1) * CACHE_COLS]]
+        for r in range(CACHE_ROWS)
+    ]
+
+# transport failures: the session is gone and has to be reopened
+COMM_ERRORS = (CommError, OSError)
+
 def require_connection(func):
+    # also serializes every call on this session, the driver isn't thread safe
     def wrapper(self, *args, **kwargs):
-        if self.plc is None:
-            print(f"❌ PLC not connected: can't run '{func.__name__}'")
-            return False
-        return func(self, *args, **kwargs)
+        with self.lock:
+            if self.plc is None:
+                # debug only: during an outage this fires on every acquisition
+                # tick, and callers report their own failures
+                log.debug("PLC not connected: can't run %r", func.__name__)
+                return False
+            return func(self, *args, **kwargs)
     return wrapper
 
 class PLCInterface:
-    def __init__(self, ip):
+    def __init__(self, ip, driver_factory=LogixDriver, fast_start=False):
+        # driver_factory(ip) -> driver; pass a plc_simulator.SimulatedLogixDriver
+        # factory to run without the ergometer.
+        # fast_start skips the full tag upload on open and only resolves
+        # APP_TAGS, from the on-disk cache when the controller program matches
         self.ip = ip
+        self.driver_factory = driver_factory
+        self.fast_start = fast_start
         self.plc = None
+        self.lock = threading.RLock()
+        # monotonic time of the last request that got a reply; the connection
+        # manager skips keepalives while acquisition keeps the session busy
+        self.last_ok = 0.0
+        self.params = ParameterSync(self)
 
+    @require_connection
     def read_array(self, base_tag, length):
-        return [self.read(f'{base_tag[:-1]}{i}]') for i in range(length)]
-
-
-
+        # whole array in one request instead of one read per element
+        name = base_tag.split('[')[0]
+        values = self.read_many(f'{name}{{{length}}}')
+        if values is None or values[0] is None:
+            return None
+        return list(values[0])
 
     def connect(self):
+        # the new driver is opened without holding the lock, so calls on this
+        # session fail fast as "not connected" instead of waiting out the
+        # connection timeout; only swapping it in is locked
+        source = None
+        driver = None
         try:
-            self.plc = LogixDriver(self.ip)
-            self.plc.open()  # 🔥 REQUIRED: registers session
-            print(f"Connected to PLC at {self.ip}")
-        except CommError as e:
-            print(f"PLC connection failed: {e}")
-            self.plc = None
+            if self.fast_start:
+                driver = self.driver_factory(self.ip, init_tags=False)
+                driver.open()  # 🔥 REQUIRED: registers session
+                try:
+                    source = load_scoped_tags(driver, self.ip, APP_TAGS)
+                except PycommError as e:
+                    # scoped upload failed: open the usual way instead
+                    log.warning("Fast start on %s failed (%s), uploading all tags", self.ip, e)
+                    driver.close()
+                    driver = self.driver_factory(self.ip)
+                    driver.open()
+                    source = "full upload"
+            else:
+                driver = self.driver_factory(self.ip)
+                driver.open()  # 🔥 REQUIRED: registers session
+        except (PycommError, OSError) as e:
+            # not only CommError: a bad reply during the tag upload raises
+            # ResponseError/DataError; either way this attempt is over
+            log.warning("PLC connection to %s failed: %s", self.ip, e)
+            if driver is not None:
+                try:
+                    driver.close()
+                except (PycommError, OSError):
+                    pass
+            return False
+
+        with self.lock:
+            old, self.plc = self.plc, driver
+            self.last_ok = time.monotonic()
+        if old is not None:
+            try:
+                old.close()
+            except COMM_ERRORS:
+                pass
+        if source:
+            log.info("Connected to PLC at %s (tag definitions from %s)", self.ip, source)
+        else:
+            log.info("Connected to PLC at %s", self.ip)
+        return True
 
     def disconnect(self):
-        if self.plc:
-            self.plc.close()
-            self.plc = None
+        with self.lock:
+            if self.plc:
+                try:
+                    self.plc.close()
+                except COMM_ERRORS:
+                    pass
+                self.plc = None
+
+    @property
+    def connected(self):
+        return self.plc is not None
+
+    def has_tag(self, tag):
+        # tag is in the connected driver's definitions: the full upload, or
+        # the APP_TAGS that resolved with fast_start (see tag_cache);
+        # None while not connected, when they aren't known
+        with self.lock:
+            if self.plc is None:
+                return None
+            return tag.split('[')[0] in self.plc._tags
+
+    def _check_comm_error(self, e):
+        # drop a broken session so require_connection fails fast until
+        # someone (e.g. ConnectionManager) reconnects
+        if isinstance(e, COMM_ERRORS):
+            log.error("Lost PLC connection at %s: %s", self.ip, e)
+            self.disconnect()
 
 
     @require_connection
     def start_pretension(self):
         writing = self.plc.write(('matlabPretensionEnable', 1))
         if writing and writing.value ==1:
-            print("🚀 Pretension routine started.")
+            log.info("Pretension routine started")
             return True
         else:
-            print("❌ Pretension Failed")
+            log.error("Pretension failed")
             return False
         
     @require_connection
+    @TELEMETRY.timed("plc.read")
     def read(self,tag_name):
         try:
             if self.plc:
                 return self.plc.read(tag_name)
         except Exception as e:
-            print(f"Error reading tag {tag_name}: {e}")
+            log.error("Error reading tag %s: %s", tag_name, e)
+            self._check_comm_error(e)
         return None
 
 
     @require_connection
+    @TELEMETRY.timed("plc.read_many")
+    def read_many(self, *tag_names):
+        # pycomm3 packs all tags into one multi-service request,
+        # returns the values in the same order (None for a failed tag)
+        try:
+            results = self.plc.read(*tag_names)
+        except Exception as e:
+            log.error("Error reading tags %s: %s", tag_names, e)
+            self._check_comm_error(e)
+            return None
+        self.last_ok = time.monotonic()
+        if len(tag_names) == 1:
+            results = [results]
+        return [r.value if r and r.error is None else None for r in results]
+
+    @require_connection
+    @TELEMETRY.timed("plc.read_data_cache")
     def read_data_cache(self):
+        frame = self.read_frame(live_tags=())
+        return frame[1] if frame else None
 
-        data_flag = self.plc.read('NewDataFlag')
-        if data_flag and data_flag.value == 1:
-            data_matrix = []
-            for row in range(6):
-                row_data = []
-                for col in range(10):
-                    tag_name = f'DataCacheMatlab[{row},{col}]'
-                    value = self.plc.read(tag_name)
-                    row_data.append(value.value if value else None)
-                data_matrix.append(row_data)
-            self.plc.write(('NewDataFlag', 0))
-            return data_matrix
-        return None
-    
+    @require_connection
+    @TELEMETRY.timed("plc.write_many")
+    def write_many(self, *tags_values):
+        # all (tag, value) pairs in one multi-service request
+        try:
+            results = self.plc.write(*tags_values)
+        except Exception as e:
+            log.error("Failed to write %s: %s", tags_values, e)
+            self._check_comm_error(e)
+            return False
+        self.last_ok = time.monotonic()
+        if len(tags_values) == 1:
+            results = [results]
+        failed = [r.tag for r in results if not r]
+        if failed:
+            TELEMETRY.count("plc.write_failed", len(failed))
+            log.warning("Write failed for %s", failed)
+        return not failed
 
     @require_connection
-    def write_spinbox_values(self, spinbox_dict):
-            print(spinbox_dict)
-            try:
-                mappings = {
-                    "Pretension (Nm)": "matlabPretension",
-                    "Torque Target (Nm)": "matlabTorqueSetpoint",
-                    "Min Torque Threshold (Nm)": "matlabTorqueSetpoint",  
-                    "Range of Motion (deg)": "matlabRange"
-                }
+    @TELEMETRY.timed("plc.read_frame")
+    def read_frame(self, live_tags=LIVE_TAGS, writes=()):
+        # one round trip for the live tags, the flag and the whole cache block,
+        # then one for the flag reset plus any queued command writes
+        tags = list(live_tags) + ['NewDataFlag', f'{CACHE_TAG}{{{CACHE_ROWS * CACHE_COLS}}}']
+        values = self.read_many(*tags)
+        if values is None:
+            if writes:
+                self.write_many(*writes)
+            return None
 
-                for label, tag in mappings.items():
-                    if label in spinbox_dict:
-                        val = float(spinbox_dict[label].get())
-                        self.write(tag, val)
+        live = dict(zip(live_tags, values))
+        flag, block = values[-2], values[-1]
+        data_matrix = None
+        writes = list(writes)
+        if flag == 1 and block is not None:
+            data_matrix = cache_matrix(block)
+            writes.insert(0, ('NewDataFlag', 0))
+        elif flag == 1:
+            # batch waiting but the block didn't read; the PLC overwrites it
+            TELEMETRY.count("plc.batches_dropped")
+        if writes:
+            self.write_many(*writes)
+        return live, data_matrix
+    
 
-            except Exception as e:
-                print(f"❌ Failed to write spinbox values: {e}")
+    @require_connection
+    def write_parameters(self, values):
+        # {spinbox label: value}; only values that changed since the last
+        # verified write go out, in one request (see parameter_sync)
+        try:
+            return self.params.sync(values)
+        except ParameterConflictError as e:
+            log.error("%s", e)
+            raise
 
     @require_connection
     def enable_test_mode(self, mode_value):
         try:
             self.plc.write('matlabTestMode', mode_value)
             self.plc.write('matlabTestingEnabled', 1)
-            print(f"✅ Test Mode {mode_value} Enabled")
+            log.info("Test mode %s enabled", mode_value)
             return True
         except Exception as e:
-            print(f"❌ Failed to enable test mode: {e}")
+            log.error("Failed to enable test mode: %s", e)
+            self._check_comm_error(e)
             return False
         
     @require_connection
     def disable_test_mode(self):
         try:
             self.plc.write('matlabTestingEnabled', 0)
-            print("🛑 Test Mode Disabled")
+            log.info("Test mode disabled")
             return True
         except Exception as e:
-            print(f"❌ Failed to disable test mode: {e}")
+            log.error("Failed to disable test mode: %s", e)
+            self._check_comm_error(e)
             return False
 
 
 
     @require_connection
+    @TELEMETRY.timed("plc.write")
     def write(self, tag, value):
         try:
             result = self.plc.write((tag, value))
             if result and result.value == value:
-                print(f"✅ Successfully wrote {value} to {tag}")
+                log.info("Wrote %s to %s", value, tag)
             else:
-                print(f"⚠️ Wrote {value} to {tag}, but verification may have failed")
+                TELEMETRY.count("plc.write_verify_failed")
+                log.warning("Wrote %s to %s, but verification may have failed", value, tag)
             return True
         except Exception as e:
-            print(f"❌ Failed to write to {tag}: {e}")
+            log.error("Failed to write to %s: %s", tag, e)
+            self._check_comm_error(e)
             return False
 
 
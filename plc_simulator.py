@@ -0,0 +1,219 @@
+import math
+import random
+import re
+import threading
+import time
+
+from plc_interface import BATCH_SEQ_TAG, CACHE_COLS, CACHE_ROWS, CACHE_TAG
+
+# 'Tag', 'Tag[3]', 'Tag[1,2]', 'Tag{60}', 'Tag[0,0]{60}'
+TAG_RE = re.compile(r'^(?P<name>[A-Za-z_]\w*)(?:\[(?P<index>[\d,\s]+)\])?(?:\{(?P<count>\d+)\})?$')
+
+
+class Tag:
+    # same shape and truthiness as pycomm3.Tag
+    __slots__ = ('tag', 'value', 'type', 'error')
+
+    def __init__(self, tag, value, type=None, error=None):
+        self.tag = tag
+        self.value = value
+        self.type = type
+        self.error = error
+
+    def __bool__(self):
+        return self.value is not None and self.error is None
+
+    def __repr__(self):
+        return f"Tag(tag={self.tag!r}, value={self.value!r}, type={self.type!r}, error={self.error!r})"
+
+
+class SimulatedLogixDriver:
+    # In-process stand-in for pycomm3.LogixDriver modelling the ergometer tags.
+    #   latency   - seconds added to every read()/write() call (one CIP round trip)
+    #   jitter    - +/- seconds of uniform noise on that latency
+    #   fill_rate - DataCacheMatlab batches (10 samples each) the PLC produces per second
+    #   seed      - makes latency noise and signal noise repeatable between runs
+    def __init__(self, ip='sim', latency=0.002, jitter=0.0, fill_rate=30, seed=0,
+                 init_tags=True, init_program_tags=True):
+        self.ip = ip
+        self.init_tags = init_tags
+        self.latency = latency
+        self.jitter = jitter
+        self.fill_rate = fill_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.connected = False
+
+        # counters for benchmarks
+        self.requests = 0
+        self.batches_filled = 0
+        self.batches_dropped = 0  # refilled before the client cleared NewDataFlag
+
+        self.tags = {
+            'matlabTorque': 0.0,
+            'matlabPosition': 0.0,
+            'NewDataFlag': 0,
+            CACHE_TAG: [[0.0] * CACHE_COLS for _ in range(CACHE_ROWS)],
+            'matlabVelocityLimit': 0,
+            'matlabTestMode': 0,
+            'matlabTestingEnabled': 0,
+            'matlabTorqueSetpoint': 50.0,
+            'matlabRange': 90.0,
+            'matlabPretension': 0.0,
+            'matlabPretensionEnable': 0,
+            BATCH_SEQ_TAG: 0,
+        }
+        self._t0 = None
+        self._filled_until = 0.0
+        self._sample_no = 0
+        self._tags = {}  # tag definitions, as LogixDriver keeps them
+        self.info = {"product_name": "Simulated Logix", "serial": "00000000",
+                     "name": "ErgometerSim", "revision": {"major": 33, "minor": 1}}
+
+    # --- LogixDriver API -------------------------------------------------
+
+    def open(self):
+        self.connected = True
+        self._t0 = time.monotonic()
+        self._filled_until = 0.0
+        if self.init_tags:
+            self.get_tag_list()
+        return True
+
+    def get_tag_list(self, program=None, cache=True, tag_namespace_filter=''):
+        self._round_trip()
+        tags = []
+        for instance_id, name in enumerate(self.tags, 1):
+            data_type, dim, dimensions = self._definition(name)
+            tags.append({"tag_name": name, "instance_id": instance_id, "data_type": data_type,
+                         "data_type_name": data_type, "dim": dim, "dimensions": dimensions})
+        if cache:
+            self._tags = {t["tag_name"]: t for t in tags}
+        return tags
+
+    def close(self):
+        self.connected = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, *tags):
+        self._round_trip()
+        with self._lock:
+            self._advance()
+            results = [self._read_one(t) for t in tags]
+        return results[0] if len(results) == 1 else results
+
+    def write(self, *tags_values):
+        # accepts write('tag', value) as well as write(('tag', value), ...)
+        if len(tags_values) == 2 and isinstance(tags_values[0], str):
+            tags_values = (tags_values,)
+        self._round_trip()
+        with self._lock:
+            self._advance()
+            results = [self._write_one(t, v) for t, v in tags_values]
+        return results[0] if len(results) == 1 else results
+
+    # --- internals -------------------------------------------------------
+
+    def _definition(self, name):
+        # -> (data type, number of dimensions, dimensions)
+        value = self.tags[name]
+        if isinstance(value, list):
+            return "REAL", 2, [CACHE_ROWS, CACHE_COLS, 0]
+        return ("DINT" if isinstance(value, int) else "REAL"), 0, [0, 0, 0]
+
+    def _round_trip(self):
+        if not self.connected:
+            raise ConnectionError(f"simulated PLC at {self.ip} is not open")
+        self.requests += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self._rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _now(self):
+        return time.monotonic() - self._t0
+
+    def _signal(self, t):
+        setpoint = float(self.tags['matlabTorqueSetpoint'] or 50.0)
+        rom = float(self.tags['matlabRange'] or 90.0)
+        phase = 2 * math.pi * 0.5 * t
+        position = rom * (0.5 - 0.5 * math.cos(phase))
+        velocity = rom * 0.5 * 2 * math.pi * 0.5 * math.sin(phase)
+        torque = setpoint * (0.5 + 0.5 * math.sin(2 * math.pi * 0.2 * t)) + self._rng.gauss(0, 0.5)
+        limit = self.tags['matlabVelocityLimit']
+        if limit:
+            velocity = max(-limit, min(limit, velocity))
+        return position, torque, velocity, setpoint - torque
+
+    def _advance(self):
+        # fill every batch that became due since the last request
+        now = self._now()
+        self.tags['matlabPosition'], self.tags['matlabTorque'] = self._signal(now)[:2]
+        if not self.fill_rate:
+            return
+        period = 1.0 / self.fill_rate
+        while self._filled_until + period <= now:
+            self._filled_until += period
+            self._fill(self._filled_until, period)
+
+    def _fill(self, t_end, period):
+        if self.tags['NewDataFlag'] == 1:
+            self.batches_dropped += 1
+        cache = [[0.0] * CACHE_COLS for _ in range(CACHE_ROWS)]
+        for c in range(CACHE_COLS):
+            t = t_end - period + (c + 1) * period / CACHE_COLS
+            pos, torque, vel, terr = self._signal(t)
+            self._sample_no += 1
+            for r, v in enumerate((pos, torque, vel, terr, t, float(self._sample_no))):
+                cache[r][c] = v
+        self.tags[CACHE_TAG] = cache
+        self.tags['NewDataFlag'] = 1
+        # DINT counter, wraps like the controller's
+        self.tags[BATCH_SEQ_TAG] = (self.tags[BATCH_SEQ_TAG] + 1 + 2**31) % 2**32 - 2**31
+        self.batches_filled += 1
+
+    def _read_one(self, tag):
+        m = TAG_RE.match(tag)
+        if not m or m.group('name') not in self.tags:
+            return Tag(tag, None, None, 'Tag doesn\'t exist')
+        value = self.tags[m.group('name')]
+        if not isinstance(value, list):
+            return Tag(tag, value, 'DINT' if isinstance(value, int) else 'REAL')
+
+        flat = [v for row in value for v in row]
+        start = self._offset(m.group('index'))
+        count = int(m.group('count') or 0)
+        if start is None or start >= len(flat) or start + count > len(flat):
+            return Tag(tag, None, None, 'Invalid array index')
+        if count:
+            return Tag(tag, flat[start:start + count], f'REAL[{count}]')
+        return Tag(tag, flat[start], 'REAL')
+
+    def _write_one(self, tag, value):
+        m = TAG_RE.match(tag)
+        name = m.group('name') if m else None
+        if name not in self.tags or isinstance(self.tags[name], list):
+            return Tag(tag, None, None, 'Tag doesn\'t exist')
+        if isinstance(self.tags[name], int):
+            value = int(value)
+        self.tags[name] = value
+        return Tag(tag, value, 'DINT' if isinstance(value, int) else 'REAL')
+
+    @staticmethod
+    def _offset(index):
+        if not index:
+            return 0
+        parts = [int(p) for p in index.split(',')]
+        if len(parts) == 1:
+            return parts[0]
+        row, col = parts
+        if row >= CACHE_ROWS or col >= CACHE_COLS:
+            return None
+        return row * CACHE_COLS + col
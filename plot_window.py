@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class MirroredRing:
+    # Circular buffer stored twice back to back, so the newest `size` values
+    # are always one contiguous slice: O(1) append and a zero-copy view,
+    # whatever the window size.
+    def __init__(self, size, fill=np.nan):
+        self.size = size
+        self._buf = np.full(2 * size, fill, dtype=float)
+        self._head = 0  # slot the next value goes into (oldest value in the view)
+
+    def append(self, value):
+        self._buf[self._head] = value
+        self._buf[self._head + self.size] = value
+        self._head = (self._head + 1) % self.size
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)[-self.size:]
+        if not len(values):
+            return
+        slots = (self._head + np.arange(len(values))) % self.size
+        self._buf[slots] = values
+        self._buf[slots + self.size] = values
+        self._head = (self._head + len(values)) % self.size
+
+    def clear(self, fill=np.nan):
+        self._buf[:] = fill
+        self._head = 0
+
+    def view(self):
+        # oldest -> newest
+        return self._buf[self._head:self._head + self.size]
+
+
+class PlanWindow:
+    # The planned trace for a window ending at plan sample `index`. Once the
+    # window is full it is a plain slice of the compiled signal; only the
+    # first `size` samples need a small zero-padded lead-in.
+    def __init__(self, signal, size):
+        self.signal = signal
+        self.size = size
+        self._lead_in = np.zeros(2 * size - 1)
+        head = signal[:size]
+        self._lead_in[size - 1:size - 1 + len(head)] = head
+
+    def view(self, index):
+        index = min(index, len(self.signal) - 1)
+        start = index - self.size + 1
+        if start >= 0:
+            return self.signal[start:index + 1]
+        return self._lead_in[index:index + self.size]
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# Built-in protocols per mode and button number.
+# Each row: [name, total time (s), target, contraction time (s), rest time (s), enabled]
+PRESETS = {
+    "Isometric": {
+        1: [["Rest", "5", "0", "0", "5", True],
+            ["Contraction", "4", "100", "4", "0", True],
+            ["Recovery","5","0","0","5", True]],
+
+        2: [["Rest","90",	"0",	"0",	"90"	,True],
+            ["Stage 1",	"595",	"20",	"2",	"3",	True],
+            ["MVIC",	"5",	"100"	,"3",	"2",	True],
+            ["Stage 2"	,"595",	"40",	"2"	,"3",	True],
+            ["MVIC"	,"5"	,"100",	"3",	"2",	True],
+            ["Stage 3","595"	,"60"	,"2"	,"3",	True],
+            ["MVIC"	,"5"	,"100",	"3",	"2",	True],
+            ["Recovery",	"5",	"0"	,"0",	"5",	True]],
+
+        3: [["D", "3", "50", "1.5", "1.5", True]]
+    },
+    "Isotonic": {
+        1: [["Rest",	"2",	"0",	"0",	"2",	True],
+            ["Contraction set",	"2"	,"100",	"1",	"0",	True],
+            ["Recovery",	"2",	"0",	"0",	"2",	True]],
+
+        2: [["F", "6", "50", "3", "2", True]],
+        3: [["G", "4", "60", "2", "1", False]]
+    },
+    "Isokinetic": {
+        1: [["Rest",	"90",	"0",	"0",	"90",	True],
+            ["C1",	"120",	"120",	"1",	"9",	True],
+            ["C2",	"119",	"120",	"1"	,"6",	True],
+            ["C3",	"120",	"120",	"1",	"4",	True],
+            ["C4"	,"120",	"120"	,"1",	"3",	True],
+            ["C5"	,"120", "120",	"1",	"1",	True],
+            ["Recovery",	"10",	"0",	"0",	"10",	True]],
+
+
+        2: [["Rest",	"90",	"0",	"0",	"90",	True],
+            ["Contractions",	"24",	"120",	"1",	"1"	,True],
+            ["Recovery",	"10",	"0",	"0",	"10"	,True]],
+
+
+        3: [["Rest",	"5",	"0",	"0",	"5",	True],
+            ["Contractions",	"6",	"120",	"1",	"1"	,True],
+            ["Recovery",	"10",	"0",	"0",	"10"	,True]],
+    }
+}
+
+PRESET_NAMES = {
+    "Isometric": ["MVIC", "ISO RAMP", "Isometric Preset 3"],
+    "Isotonic": ["Isotonic Preset 1", "Isotonic Preset 2", "Isotonic Preset 3"],
+    "Isokinetic": ["Frequency Ramp", "Oxidative Capacity", "Practice"]
+}
+
+
+def get_preset(mode, preset_number):
+    return PRESETS.get(mode, {}).get(preset_number, [])
+
+
+# User protocols live in a JSON file next to the built-ins:
+#   {"version": 1, "presets": {"Isometric": [{"name": ..., "stages": [rows]}, ...]}}
+# A user preset with a built-in's name replaces it; others are appended after
+# the built-ins. Any number of stages per preset.
+PRESET_FILE = os.path.join(os.path.expanduser("~"), ".ergometer", "presets.json")
+
+
+class PresetLibrary:
+    # plan_cache_dir defaults to plan_compiler.PLAN_CACHE_DIR
+    def __init__(self, path=PRESET_FILE, plan_cache_dir=None):
+        self.path = path
+        self.plan_cache_dir = plan_cache_dir
+        self.user = self._read()
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("presets", {})
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring preset library %s: %s", self.path, e)
+            return {}
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "presets": self.user}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def entries(self, mode):
+        # [(name, rows)] in button order, preset numbers start at 1
+        builtin = PRESETS.get(mode, {})
+        names = PRESET_NAMES.get(mode, [])
+        entries = [(names[n - 1] if n - 1 < len(names) else f"Preset {n}", builtin[n])
+                   for n in sorted(builtin)]
+        for preset in self.user.get(mode, []):
+            for i, (name, _) in enumerate(entries):
+                if name == preset["name"]:
+                    entries[i] = (name, preset["stages"])
+                    break
+            else:
+                entries.append((preset["name"], preset["stages"]))
+        return entries
+
+    def names(self, mode):
+        return [name for name, _ in self.entries(mode)]
+
+    def get(self, mode, preset_number):
+        entries = self.entries(mode)
+        if 1 <= preset_number <= len(entries):
+            return entries[preset_number - 1][1]
+        return []
+
+    def find(self, mode, name):
+        # preset number for a name, or None
+        names = self.names(mode)
+        return names.index(name) + 1 if name in names else None
+
+    def save(self, mode, name, rows):
+        # add or replace a user preset, and compile its plan ahead of time
+        rows = [list(row) for row in rows]
+        presets = [p for p in self.user.get(mode, []) if p["name"] != name]
+        presets.append({"name": name, "stages": rows})
+        self.user[mode] = presets
+        self._write()
+        self.plan(rows)
+
+    def delete(self, mode, name):
+        presets = self.user.get(mode, [])
+        self.user[mode] = [p for p in presets if p["name"] != name]
+        if len(self.user[mode]) != len(presets):
+            self._write()
+
+    def plan(self, rows, frame_rate=None):
+        # compiled plan for preset rows, from the on-disk plan cache when possible
+        # (plan_compiler needs numpy, so it is only imported here)
+        from plan_compiler import FRAME_RATE, PLAN_CACHE_DIR, compile_plan, stages_from_rows
+        return compile_plan(stages_from_rows(rows), frame_rate or FRAME_RATE,
+                            cache_dir=self.plan_cache_dir or PLAN_CACHE_DIR)
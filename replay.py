@@ -0,0 +1,215 @@
+import argparse
+import json
+import logging
+import os
+import time
+import tkinter as tk
+
+import numpy as np
+
+from graph_view import LiveGraphView
+from pacing import FramePacer
+from plan_compiler import FRAME_RATE, compile_plan, stages_from_rows
+from session_config import live_scale
+from session_log import SessionLogReader
+
+log = logging.getLogger(__name__)
+
+SPEEDS = (1, 2, 5, 10, 25, 50, 100)
+
+
+class ReplaySource:
+    # Logged samples looked up by session time straight from the log's memory
+    # map. Only the first timestamp of each block is kept in memory, so a
+    # multi-hour log opens in (nearly) constant memory and any point in it is
+    # one binary search away.
+    def __init__(self, reader, column):
+        self.reader = reader
+        self.column = column
+        self.block_ts = reader.block_first("timestamp") if len(reader) else np.zeros(0)
+        self.t_start = float(self.block_ts[0]) if len(self.block_ts) else 0.0
+        last = reader.block_last("timestamp")
+        self.duration = float(last) - self.t_start if last is not None else 0.0
+        self._span = None  # (first block, end block, timestamps, values)
+
+    def values_at(self, times):
+        # live value at each session time (seconds, ascending): the newest
+        # sample logged at or before it, NaN before the first one
+        times = np.asarray(times, dtype=float) + self.t_start
+        out = np.full(len(times), np.nan)
+        if not len(times) or not len(self.block_ts):
+            return out
+        b0 = max(0, int(np.searchsorted(self.block_ts, times[0], "right")) - 1)
+        b1 = max(b0 + 1, int(np.searchsorted(self.block_ts, times[-1], "right")))
+        ts, values = self._rows(b0, b1)
+        idx = np.searchsorted(ts, times, "right") - 1
+        valid = idx >= 0
+        out[valid] = values[idx[valid]]
+        return out
+
+    def _rows(self, b0, b1):
+        span = self._span
+        if span is None or span[0] != b0 or span[1] != b1:
+            blocks = [self.reader.block(b) for b in range(b0, b1)]
+            span = self._span = (
+                b0, b1,
+                np.concatenate([blk["timestamp"] for blk in blocks]),
+                np.concatenate([blk[self.column] for blk in blocks]).astype(float),
+            )
+        return span[2], span[3]
+
+
+def load_metadata(log_path):
+    meta_path = os.path.splitext(log_path)[0] + ".session.json"
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class SessionReplay:
+    # Plays a finished session back through the live graph view at 1x-100x,
+    # with pause and seeking. Nothing is loaded up front; every frame reads
+    # just the samples it shows from the memory-mapped log.
+    def __init__(self, root, log_path, speed=1, display_fps=30):
+        self.reader = SessionLogReader(log_path)
+        meta = load_metadata(log_path)
+        self.mode = meta.get("mode") or self.reader.header.get("mode") or "Isometric"
+        self.frame_rate = meta.get("frame_rate", FRAME_RATE)
+        column = "position" if self.mode in ("Isotonic", "Isokinetic") else "torque"
+        self.source = ReplaySource(self.reader, column)
+        self.scale = live_scale(self.mode, meta.get("parameters") or {})
+        if not meta.get("parameters"):
+            log.warning("%s has no session parameters, showing raw %s", log_path, column)
+
+        plan = compile_plan(stages_from_rows(meta.get("stages") or []), self.frame_rate)
+        signal = plan.signal
+        self.duration = max(self.source.duration, plan.duration)
+        if not len(signal):
+            signal = np.zeros(max(1, int(self.duration * self.frame_rate)))
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"Replay - {os.path.basename(log_path)}")
+        self.window.geometry("1400x900")
+        self.window.minsize(800, 600)
+
+        controls = tk.Frame(self.window)
+        controls.pack(side="bottom", fill="x", padx=10, pady=5)
+        self.play_button = tk.Button(controls, text="Pause", width=8, command=self.toggle)
+        self.play_button.pack(side="left")
+        self.speed_var = tk.StringVar(value=f"{speed}x")
+        tk.OptionMenu(controls, self.speed_var, *(f"{s}x" for s in SPEEDS),
+                      command=lambda _: self.set_speed(float(self.speed_var.get().rstrip("x")))
+                      ).pack(side="left", padx=5)
+        # the slider follows playback unless it is being dragged; dragging seeks
+        self.slider = tk.Scale(controls, from_=0, to=max(self.duration, 0.1), resolution=0.1,
+                               orient="horizontal", showvalue=False)
+        self.slider.pack(side="left", fill="x", expand=True, padx=5)
+        self.slider.bind("<ButtonPress-1>", self._on_press)
+        self.slider.bind("<B1-Motion>", self._on_drag)
+        self.slider.bind("<ButtonRelease-1>", self._on_release)
+        self.time_label = tk.Label(controls, width=18, anchor="e")
+        self.time_label.pack(side="right")
+
+        self.view = LiveGraphView(self.window, self.mode, signal, self.frame_rate)
+        self.view.widget.pack(fill=tk.BOTH, expand=True)
+
+        self.speed = float(speed)
+        self.playing = True
+        self._origin = (time.monotonic(), 0.0)  # (wall clock, session time) at last rebase
+        self._shown = -1  # newest plan sample pushed to the view
+        self._dragging = False
+
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.pacer = FramePacer(self.window, self._draw_frame, target_fps=display_fps)
+        self.view.draw()
+        self.pacer.start()
+
+    @property
+    def position(self):
+        wall, pos = self._origin
+        if self.playing:
+            pos += (time.monotonic() - wall) * self.speed
+        return min(pos, self.duration)
+
+    def _rebase(self, pos):
+        self._origin = (time.monotonic(), pos)
+
+    def toggle(self):
+        self._rebase(self.position)
+        self.playing = not self.playing
+        if self.playing and self.position >= self.duration:
+            self.seek(0.0)
+        self.play_button.config(text="Pause" if self.playing else "Play")
+
+    def set_speed(self, speed):
+        self._rebase(self.position)
+        self.speed = speed
+
+    def seek(self, pos):
+        pos = min(max(0.0, pos), self.duration)
+        self._rebase(pos)
+        # refill the live trace with the window leading up to the new position
+        self.view.clear()
+        self._shown = int(pos * self.frame_rate) - self.view.live_ring.size
+
+    # widget bindings run before the Scale's own, so read the value once idle
+    def _on_press(self, event):
+        self._dragging = True
+
+    def _on_drag(self, event):
+        self.slider.after_idle(lambda: self.seek(self.slider.get()))
+
+    def _on_release(self, event):
+        self._dragging = False
+        self.slider.after_idle(lambda: self.seek(self.slider.get()))
+
+    def _draw_frame(self):
+        pos = self.position
+        index = int(pos * self.frame_rate)
+        if index > self._shown:
+            first = max(self._shown + 1, index - self.view.live_ring.size + 1)
+            indices = np.arange(first, index + 1)
+            self.view.push(self.source.values_at(indices / self.frame_rate) * self.scale)
+            self._shown = index
+            self.view.show(index)
+            self.view.set_status(f"replay {self.speed:g}x   {self.mode}")
+            self.view.update()
+
+            if not self._dragging:
+                self.slider.set(round(pos, 1))
+            self.time_label.config(text=f"{_clock(pos)} / {_clock(self.duration)}")
+
+        if self.playing and pos >= self.duration:
+            self.toggle()  # stop at the end; Play starts over
+        return True
+
+    def close(self):
+        self.pacer.stop()
+        self.view.close()
+        self.window.destroy()
+
+
+def _clock(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded ergometer session")
+    parser.add_argument("log", help="session .ergolog file")
+    parser.add_argument("--speed", type=float, default=1, help="playback speed (1-100)")
+    args = parser.parse_args(argv)
+    if not 1 <= args.speed <= 100:
+        parser.error("--speed must be between 1 and 100")
+
+    root = tk.Tk()
+    root.withdraw()
+    replay = SessionReplay(root, args.log, speed=args.speed)
+    replay.window.bind("<Destroy>", lambda e: root.quit() if e.widget is replay.window else None)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import tkinter as tk
+
+# One window over every rig: link state, session progress and data
+# accounting, refreshed from RigPool.status() on the Tk thread.
+
+COLUMNS = [
+    ("Rig", "name", 12),
+    ("PLC", "link_text", 32),
+    ("Session", "session", 9),
+    ("Mode", "mode", 10),
+    ("Progress", "progress", 8),
+    ("Samples", "samples", 9),
+    ("Batches", "batches", 8),
+    ("Missed", "missed_batches", 7),
+    ("Lost", "lost_samples", 6),
+    ("Late", "late_samples", 6),
+    ("Live (%)", "live", 8),
+    ("Subscribers", "subscribers", 10),
+]
+
+LINK_COLORS = {"connected": "darkgreen", "degraded": "orange"}
+
+
+def _text(key, value):
+    if value is None:
+        return "-"
+    if key == "progress":
+        return f"{value:.0%}"
+    if key == "live":
+        return f"{value:.1f}"
+    return str(value)
+
+
+class RigDashboard:
+    def __init__(self, root, pool, interval_ms=500):
+        self.pool = pool
+        self.interval_ms = interval_ms
+        self.window = tk.Toplevel(root)
+        self.window.title("Rigs")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        for col, (title, _, width) in enumerate(COLUMNS):
+            tk.Label(self.window, text=title, width=width, font=("Times New Roman", 12, "bold"),
+                     borderwidth=1, relief="solid").grid(row=0, column=col, sticky="nsew")
+
+        self.cells = []
+        for row in range(len(pool) + 1):  # one per rig, then the totals
+            labels = []
+            for col, (_, _, width) in enumerate(COLUMNS):
+                label = tk.Label(self.window, width=width, font=("Georgia", 11),
+                                 anchor="w" if col < 2 else "e")
+                label.grid(row=row + 1, column=col, sticky="nsew", padx=2)
+                labels.append(label)
+            self.cells.append(labels)
+
+        self._job = None
+        self.refresh()
+
+    def refresh(self):
+        rigs, total = self.pool.status()
+        for labels, status in zip(self.cells, rigs):
+            for label, (_, key, _) in zip(labels, COLUMNS):
+                label.config(text=_text(key, status.get(key)))
+            labels[1].config(fg=LINK_COLORS.get(status["link"], "red"))
+
+        totals = dict(total, name="All rigs",
+                      link_text=f"{total['connected']}/{total['rigs']} connected",
+                      session=f"{total['running']} running")
+        for label, (_, key, _) in zip(self.cells[-1], COLUMNS):
+            label.config(text=_text(key, totals.get(key)), font=("Georgia", 11, "bold"))
+        self._job = self.window.after(self.interval_ms, self.refresh)
+
+    def close(self):
+        if self._job is not None:
+            self.window.after_cancel(self._job)
+        self.window.destroy()
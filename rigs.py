@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_plc import AsyncPLCInterface
+from connection_manager import ConnectionManager
+from plc_interface import PLC_IP, LogixDriver
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+# Several ergometer rigs from one process. Every rig has its own PLC
+# sessions (each with its own lock), command queue and session, so one rig
+# never waits on another's round trips. Each acquisition loop has a thread
+# of its own; the log writers and CSV exports of all rigs share one pool.
+#
+# The rig list is a JSON file (ERGO_RIGS, or ~/.ergometer/rigs.json):
+#   [{"name": "Rig A", "ip": "192.168.1.10"}, {"name": "Rig B", "ip": "192.168.1.11"}]
+# An ip starting with "sim" runs that rig on the in-process PLC simulator;
+# "stream_port" sets where the rig's live batches are published.
+
+RIGS_FILE = os.path.join(os.path.expanduser("~"), ".ergometer", "rigs.json")
+
+
+def load_rig_specs(path=None):
+    # -> [{"name", "ip"}]; a single rig when there is no rig file
+    path = path or os.environ.get("ERGO_RIGS") or RIGS_FILE
+    if os.path.exists(path):
+        with open(path) as f:
+            specs = json.load(f)
+        return [dict(spec, name=spec.get("name") or spec["ip"]) for spec in specs]
+    ip = "sim" if os.environ.get("ERGO_SIMULATOR") else PLC_IP
+    return [{"name": "Rig 1", "ip": ip}]
+
+
+def driver_for(ip):
+    if ip.startswith("sim"):
+        from plc_simulator import SimulatedLogixDriver
+        return SimulatedLogixDriver
+    return LogixDriver
+
+
+class RigSession:
+    # One session on one rig, from a SessionConfig: the binary session log
+    # and the acquisition engine that feeds it, plus the session.json
+    # records at start and finish. Shared by the live graph, the headless
+    # runner and multi-rig runs.
+    # publisher: a live_stream.LivePublisher that gets every batch as well.
+    # The log is compressed with log_codec and split into parts of at most
+    # log_max_bytes (see session_log).
+    def __init__(self, config, stream, control, lock=None, out_dir="logs", export_csv=True,
+                 cache_poll_hz=120, executor=None, publisher=None, log_codec="zlib",
+                 log_max_bytes=None, **metadata):
+        from acquisition import AcquisitionEngine
+        from session_log import BinarySessionLog, session_paths, update_session_metadata
+
+        if config.seq_tag and stream.has_tag(config.seq_tag) is False:
+            # not in this controller's program; reading it anyway fails on
+            # every request. Kept while the tag list isn't known yet.
+            log.warning("%s not defined on the controller, batch sequence tracking is off", config.seq_tag)
+            config = config._replace(seq_tag=None)
+        self.config = config
+        self.executor = executor
+        self.ts, self.paths = session_paths(config.mode, out_dir)
+        csv_path = self.paths["csv"] if export_csv else None
+        self.log = BinarySessionLog(self.paths["log"], mode=config.mode, session=self.ts,
+                                    export_csv=csv_path, executor=executor, codec=log_codec,
+                                    max_bytes=log_max_bytes)
+        update_session_metadata(
+            self.paths["meta"], session=self.ts, log=self.paths["log"], csv=csv_path,
+            **metadata, **config.metadata()
+        )
+        self.publisher = publisher
+        self.metadata = metadata
+        on_batch = self.log.append_batch
+        if publisher is not None:
+            append, publish = self.log.append_batch, publisher.publish
+
+            def on_batch(timestamp, data_matrix):
+                append(timestamp, data_matrix)
+                publish(timestamp, data_matrix)
+
+        self.engine = AcquisitionEngine(
+            stream, config.plan.signal, config.live_tag,
+            control=control,
+            lock=lock,
+            rate_hz=config.frame_rate,
+            velocity_schedule=config.velocity_schedule,
+            on_batch=on_batch,
+            cache_poll_hz=cache_poll_hz,
+            seq_tag=config.seq_tag,
+        )
+        self.summary = None
+
+    @property
+    def running(self):
+        return self.summary is None
+
+    def start(self):
+        if self.publisher is not None:
+            self.publisher.begin(session=self.ts, mode=self.config.mode, frame_rate=self.config.frame_rate,
+                                 parameters=dict(self.config.parameters), log=self.paths["log"],
+                                 **self.metadata)
+        # a dedicated thread: the loop must never queue behind pool work such
+        # as the previous session's CSV export, test mode is already on
+        self.engine.start()
+
+    def stop(self):
+        self.engine.stop()
+
+    def finish(self, wait=True, **metadata):
+        # closes the log and records how the run went; safe to call twice
+        from session_log import update_session_metadata
+
+        if self.summary is not None:
+            return self.summary
+        self.log.close(wait=wait)
+        engine = self.engine
+        self.summary = {
+            "session": self.ts,
+            "log": self.paths["log"],
+            "samples": self.log.rows,
+            "timing": engine.timing_report(),
+            "link": engine.link_report(),
+            "batches": engine.batch_report(),
+            "error": engine.error,
+            "log_error": self.log.error,  # known by now only if the close waited
+        }
+        update_session_metadata(self.paths["meta"], timing=self.summary["timing"],
+                                link=self.summary["link"], batches=self.summary["batches"],
+                                error=engine.error, log_error=self.log.error, **metadata)
+        if TELEMETRY.enabled:
+            update_session_metadata(self.paths["meta"], telemetry=TELEMETRY.snapshot())
+        if self.publisher is not None:
+            self.publisher.end(session=self.ts, samples=self.log.rows, **metadata)
+        return self.summary
+
+
+class Rig:
+    # stream_port: publish this rig's batches on that localhost port (0 picks
+    # one), and in shared memory shm_name as well, if given (see live_stream)
+    def __init__(self, name, ip, driver_factory=None, fast_start=True, executor=None,
+                 stream_port=None, shm_name=None):
+        self.name = name
+        self.ip = ip
+        self.link = ConnectionManager(ip, driver_factory=driver_factory or driver_for(ip),
+                                      fast_start=fast_start)
+        self.plc = self.link.control
+        self.stream = self.link.stream
+        self.plc_async = AsyncPLCInterface(self.plc)
+        self.executor = executor
+        self.session = None  # the current or last RigSession
+        self.publisher = None
+        if stream_port is not None:
+            from live_stream import LivePublisher  # numpy
+            self.publisher = LivePublisher(stream_port, shm_name=shm_name)
+
+    @property
+    def lock(self):
+        # serializes the acquisition engine with other users of this rig's
+        # streaming session only
+        return self.stream.lock
+
+    def start(self):
+        if self.publisher is not None:
+            try:
+                self.publisher.start()
+            except OSError as e:
+                # the rig runs as usual, just without the live stream
+                log.warning("%s: live stream disabled, can't publish on port %s: %s",
+                            self.name, self.publisher.requested_port, e)
+                self.publisher = None
+        self.link.start()
+
+    def stop(self):
+        if self.session is not None and self.session.running:
+            self.session.stop()
+            self.session.finish()
+        if self.publisher is not None:
+            self.publisher.stop()
+        self.plc_async.close()
+        self.link.stop()
+
+    def new_session(self, config, **kwargs):
+        # a RigSession on this rig's sessions and the shared pool; start() it
+        if self.session is not None and self.session.running:
+            raise RuntimeError(f"{self.name} already has a session running")
+        self.session = RigSession(config, self.stream, self.plc, lock=self.lock,
+                                  executor=self.executor, publisher=self.publisher, rig=self.name,
+                                  **kwargs)
+        return self.session
+
+    def status(self):
+        # plain values for the dashboard; read from any thread
+        status = {"name": self.name, "ip": self.ip, "link": self.link.state,
+                  "link_text": self.link.status_text(), "session": "idle"}
+        if self.publisher is not None:
+            status["subscribers"] = len(self.publisher.stats()["subscribers"])
+        session = self.session
+        if session is not None:
+            engine = session.engine
+            plan_len = len(session.config.plan.signal)
+            latest = engine.ring.latest()
+            status.update(
+                session="running" if session.running and not engine.finished.is_set() else "finished",
+                mode=session.config.mode,
+                progress=min(1.0, (engine.index + 1) / plan_len) if plan_len else 1.0,
+                samples=session.log.rows,
+                batches=engine.batches.batches,
+                missed_batches=engine.batches.missed,
+                lost_samples=engine.lost_samples,
+                late_samples=engine.late_ticks,
+                live=latest[3] * session.config.scale if latest else None,
+            )
+        return status
+
+
+class RigPool:
+    # All rigs, and the thread pool their session logs run on. A rig holds at
+    # most two workers at once (the running session's log writer and the last
+    # session's CSV export, see RigSession.finish(wait=False)); two per rig
+    # plus some slack so no writer ever waits for a worker.
+    # stream_port: live batches of rig i on stream_port + i (a rig's own
+    # "stream_port" wins); shm: a shared memory ring per rig as well
+    def __init__(self, specs, fast_start=True, stream_port=None, shm=False):
+        self.executor = ThreadPoolExecutor(max_workers=2 * max(1, len(specs)) + 2,
+                                           thread_name_prefix="rig")
+        self.rigs = []
+        for i, spec in enumerate(specs):
+            port = spec.get("stream_port")
+            if port is None and stream_port is not None:
+                port = stream_port + i if stream_port else 0
+            self.rigs.append(Rig(spec["name"], spec["ip"], fast_start=fast_start, executor=self.executor,
+                                 stream_port=port, shm_name=f"ergometer_rig{i + 1}" if shm else None))
+        self._started = time.monotonic()
+
+    def __iter__(self):
+        return iter(self.rigs)
+
+    def __len__(self):
+        return len(self.rigs)
+
+    def rig(self, name):
+        for rig in self.rigs:
+            if rig.name == name:
+                return rig
+        raise KeyError(name)
+
+    def start(self):
+        for rig in self.rigs:
+            rig.start()
+
+    def stop(self):
+        # rigs in parallel: each may wait on its own PLC to disable test mode
+        threads = [threading.Thread(target=rig.stop, name=f"stop-{rig.name}") for rig in self.rigs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.executor.shutdown(wait=False)
+
+    def status(self):
+        # per-rig status, plus totals over the rigs with a session
+        rigs = [rig.status() for rig in self.rigs]
+        total = {"rigs": len(rigs),
+                 "connected": sum(1 for s in rigs if s["link"] == "connected"),
+                 "running": sum(1 for s in rigs if s["session"] == "running")}
+        for key in ("samples", "batches", "missed_batches", "lost_samples"):
+            total[key] = sum(s.get(key, 0) for s in rigs)
+        return rigs, total
@@ -0,0 +1,108 @@
+import math
+import time
+
+import numpy as np
+
+
+class PlanScheduler:
+    # Works out which plan sample is due from a monotonic clock: sample i is
+    # due at t0 + i / rate. Deadlines are never accumulated from sleeps, so
+    # timer jitter and slow ticks can't stretch the protocol.
+    #
+    # Catch-up policy when the caller falls behind:
+    #   "skip"  - jump straight to the sample that is due now (default)
+    #   "burst" - run the missed samples back to back, but skip ahead once
+    #             more than max_burst samples behind
+    CATCH_UP_POLICIES = ("skip", "burst")
+
+    def __init__(self, length, rate, catch_up="skip", max_burst=5, clock=time.monotonic):
+        if catch_up not in self.CATCH_UP_POLICIES:
+            raise ValueError(f"catch_up must be one of {self.CATCH_UP_POLICIES}")
+        self.length = length
+        self.rate = rate
+        self.catch_up = catch_up
+        self.max_burst = max_burst
+        self.clock = clock
+
+        self.t0 = None
+        self.next_index = 0
+        self.skipped = 0
+        self.burst = 0
+        self._lateness = np.zeros(length)
+        self._issued = np.zeros(length, dtype=bool)
+
+    def start(self):
+        self.t0 = self.clock()
+
+    def deadline(self, index):
+        return self.t0 + index / self.rate
+
+    @property
+    def end_time(self):
+        # the plan is over once its last sample period has elapsed
+        return self.deadline(self.length)
+
+    def done(self):
+        return self.next_index >= self.length
+
+    def poll(self):
+        # -> (first, index): run sample `index` now; samples first..index-1
+        # were skipped. None when nothing is due yet.
+        if self.done():
+            return None
+        now = self.clock()
+        due = min(self.length, math.floor((now - self.t0) * self.rate) + 1)
+        if due <= self.next_index:
+            return None
+
+        first = self.next_index
+        behind = due - 1 - first
+        if behind > 0 and (self.catch_up == "skip" or behind > self.max_burst):
+            self.skipped += behind
+            index = due - 1
+        else:
+            if behind > 0:
+                self.burst += 1
+            index = first
+
+        self.next_index = index + 1
+        self._lateness[index] = now - self.deadline(index)
+        self._issued[index] = True
+        return first, index
+
+    def wait_time(self):
+        # seconds until the next sample (or the end of the plan) is due
+        target = self.end_time if self.done() else self.deadline(self.next_index)
+        return max(0.0, target - self.clock())
+
+    @property
+    def late_samples(self):
+        # issued more than one sample period after their deadline
+        return int(np.count_nonzero(self._lateness[self._issued] > 1.0 / self.rate))
+
+    def report(self, finished_at=None):
+        lateness = self._lateness[self._issued]
+        planned = self.length / self.rate
+        report = {
+            "rate_hz": self.rate,
+            "catch_up": self.catch_up,
+            "planned_samples": self.length,
+            "issued_samples": int(self._issued.sum()),
+            "skipped_samples": self.skipped,
+            "burst_samples": self.burst,
+            "late_samples": self.late_samples,
+            "planned_duration_s": planned,
+        }
+        if len(lateness):
+            report.update({
+                "lateness_ms_p50": round(float(np.percentile(lateness, 50)) * 1000, 3),
+                "lateness_ms_p99": round(float(np.percentile(lateness, 99)) * 1000, 3),
+                "lateness_ms_max": round(float(lateness.max()) * 1000, 3),
+            })
+        if finished_at is not None and self.t0 is not None:
+            actual = finished_at - self.t0
+            report.update({
+                "actual_duration_s": round(actual, 4),
+                "end_drift_ms": round((actual - planned) * 1000, 3),
+            })
+        return report
@@ -0,0 +1,83 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+from plc_interface import BATCH_SEQ_TAG, MODE_LIVE_TAGS, TEST_MODES
+
+# Everything a running session needs, fixed when it starts. The acquisition
+# thread and the draw loop only read from this snapshot, never from Tk
+# widgets, so editing a spinbox mid-session can't change the scaling.
+
+# parameter the live value is shown as a percentage of, per mode
+SCALE_PARAMETERS = {
+    "Isometric": "Torque Target (Nm)",
+    "Isotonic": "Range of Motion (deg)",
+    "Isokinetic": "Range of Motion (deg)",
+}
+
+# modes that send matlabVelocityLimit commands from the plan
+VELOCITY_MODES = ("Isokinetic",)
+
+
+def scale_denominator(mode, parameters):
+    # value of the mode's reference parameter, or None when there isn't one
+    try:
+        return float(parameters[SCALE_PARAMETERS[mode]]) or None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def live_scale(mode, parameters):
+    # factor that turns the raw live value into % of the mode's reference
+    denom = scale_denominator(mode, parameters)
+    return 100 / denom if denom else 1
+
+
+def _raw_values(samples):
+    return [s[3] for s in samples]
+
+
+def _percent_values(scale):
+    def values(samples):
+        return [s[3] * scale for s in samples]
+    return values
+
+
+class SessionConfig(namedtuple("SessionConfig", (
+        "mode test_mode live_tag seq_tag parameters scale_parameter scale_denominator "
+        "scale plan velocity_schedule display"))):
+    # parameters is read-only; display(samples) maps SampleRing samples to the
+    # values drawn, picked for the mode when the session starts
+    __slots__ = ()
+
+    @property
+    def frame_rate(self):
+        return self.plan.frame_rate
+
+    def metadata(self):
+        # the session.json fields that describe the setup
+        return {
+            "mode": self.mode,
+            "frame_rate": self.frame_rate,
+            "stages": [list(stage) for stage in self.plan.stages],
+            "parameters": dict(self.parameters),
+        }
+
+
+def build_session_config(mode, plan, parameters=None, seq_tag=BATCH_SEQ_TAG):
+    # parameters: {spinbox label: value} as they are at session start
+    parameters = MappingProxyType(dict(parameters or {}))
+    denom = scale_denominator(mode, parameters)
+    scale = 100 / denom if denom else 1
+    return SessionConfig(
+        mode=mode,
+        test_mode=TEST_MODES.get(mode),
+        live_tag=MODE_LIVE_TAGS.get(mode, 'matlabTorque'),
+        seq_tag=seq_tag,
+        parameters=parameters,
+        scale_parameter=SCALE_PARAMETERS.get(mode),
+        scale_denominator=denom,
+        scale=scale,
+        plan=plan,
+        velocity_schedule=plan.velocity_schedule if mode in VELOCITY_MODES else None,
+        display=_percent_values(scale) if denom else _raw_values,
+    )
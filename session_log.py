@@ -0,0 +1,497 @@
+import csv
+import itertools
+import json
+import logging
+import lzma
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from telemetry import TELEMETRY
+
+log = logging.getLogger(__name__)
+
+# Binary columnar session log (.ergolog)
+#
+#   magic (8 bytes) | header length (uint32) | JSON header, padded to 8 bytes
+#   block 0 | block 1 | ...
+#
+# Version 1: every block has the same size: an 8 byte prefix (uint32 valid
+# rows, uint32 reserved) followed by each column as block_rows little-endian
+# values, so a row's position in the file is known without scanning and
+# blocks can be viewed straight out of a memory map.
+#
+# Version 2 (a codec or size rotation asked for): blocks ("chunks") hold only
+# their valid rows, column after column, compressed with the header's codec;
+# the prefix's second field is the payload length. The log may be split into
+# parts <log>, <log>.1, <log>.2, ... (each with its own header), and every
+# chunk has a fixed-size record in <log>.idx:
+#
+#   part | rows | offset | bytes | first sample index | first / last timestamp
+#
+# so a sample or time range is found from the index alone and only the
+# chunks that hold it are read and decompressed.
+
+MAGIC = b"ERGOLOG1"
+COLUMNS = (
+    ("index", "<i8"),
+    ("timestamp", "<f8"),
+    ("position", "<f4"),
+    ("torque", "<f4"),
+    ("velocity", "<f4"),
+    ("torque_error", "<f4"),
+)
+# DataCacheMatlab rows that feed the data columns
+DATA_ROWS = (("position", 0), ("torque", 1), ("velocity", 2), ("torque_error", 3))
+CSV_HEADER = ["Index", "Time Stamp", "Position", "Torque", "Velocity", "Torque Error"]
+BLOCK_PREFIX = struct.Struct("<II")
+INDEX_DTYPE = np.dtype([
+    ("part", "<u4"), ("rows", "<u4"), ("offset", "<u8"), ("nbytes", "<u8"),
+    ("first_index", "<i8"), ("first_ts", "<f8"), ("last_ts", "<f8"),
+])
+# codec name in the header -> (compress(data, level), decompress(data))
+CODECS = {
+    None: (lambda data, level: data, bytes),
+    "zlib": (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    "lzma": (lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress),
+}
+
+
+def block_nbytes(block_rows, columns=COLUMNS):
+    return BLOCK_PREFIX.size + sum(np.dtype(dt).itemsize * block_rows for _, dt in columns)
+
+
+def part_path(path, part):
+    return path if part == 0 else f"{path}.{part}"
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class BinarySessionLog:
+    # The acquisition thread only copies samples into preallocated column
+    # buffers; full blocks go to a writer thread that owns the file.
+    # executor: run the writer on a shared pool (see rigs.RigPool) instead of
+    # a thread of its own. codec ("zlib", "lzma") and max_bytes (start a new
+    # part file past this size) write a version 2 log; compression runs on
+    # the writer thread.
+    def __init__(self, path, mode=None, session=None, block_rows=1024, buffers=4, export_csv=None,
+                 executor=None, codec=None, level=None, max_bytes=None):
+        if codec not in CODECS:
+            raise ValueError(f"unknown log codec {codec!r}, use one of {sorted(filter(None, CODECS))}")
+        self.path = path
+        self.block_rows = block_rows
+        self.export_csv = export_csv
+        self.version = 2 if codec or max_bytes else 1
+        self.codec = codec
+        self.level = level
+        self.max_bytes = max_bytes
+        self.header = {
+            "version": self.version,
+            "columns": [list(c) for c in COLUMNS],
+            "block_rows": block_rows,
+            "mode": mode,
+            "session": session,
+            "created": time.time(),
+        }
+        if self.version == 2:
+            self.header.update(codec=codec, part=0)
+        self.rows = 0
+        self.part = 0
+        self._part_chunks = 0
+
+        self._file = open(path, "wb")
+        self._write_header()
+        self._index = open(index_path(path), "wb") if self.version == 2 else None
+
+        self._free = queue.Queue()
+        for _ in range(buffers):
+            self._free.put(self._new_block())
+        self._pending = queue.Queue()
+        self._block = self._free.get()
+        self._fill = 0
+        self._closed = False
+        self.error = None  # why the writer stopped, if it failed
+
+        self._done = threading.Event()
+        if executor is not None:
+            executor.submit(self._writer)
+        else:
+            threading.Thread(target=self._writer, name="session-log", daemon=True).start()
+
+    def _write_header(self):
+        if self.version == 2:
+            self.header["part"] = self.part
+        header = json.dumps(self.header).encode()
+        pad = -(len(MAGIC) + 4 + len(header)) % 8
+        self._file.write(MAGIC + struct.pack("<I", len(header) + pad) + header + b" " * pad)
+
+    def _new_block(self):
+        return {name: np.zeros(self.block_rows, dtype=dt) for name, dt in COLUMNS}
+
+    def append_batch(self, timestamp, data_matrix):
+        # one DataCacheMatlab batch: rows 0-3 hold position/torque/velocity/error
+        n = len(data_matrix[0])
+        pos = 0
+        while pos < n:
+            take = min(n - pos, self.block_rows - self._fill)
+            block, fill = self._block, self._fill
+            block["index"][fill:fill + take] = np.arange(self.rows + 1, self.rows + 1 + take)
+            block["timestamp"][fill:fill + take] = timestamp
+            for name, row in DATA_ROWS:
+                block[name][fill:fill + take] = data_matrix[row][pos:pos + take]
+            self._fill += take
+            self.rows += take
+            pos += take
+            if self._fill == self.block_rows:
+                self._submit()
+
+    def _submit(self):
+        if self.error is not None:
+            # nothing would write the block; stop the session instead of
+            # queueing samples that are never written
+            raise OSError(f"session log {self.path} is not being written: {self.error}")
+        if not self._fill:
+            return
+        self._pending.put((self._block, self._fill))
+        try:
+            self._block = self._free.get_nowait()
+        except queue.Empty:
+            # writer is behind; grow the pool rather than stall acquisition
+            self._block = self._new_block()
+        self._fill = 0
+
+    def _writer(self):
+        try:
+            self._write_blocks()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            log.exception("Session log writer for %s failed", self.path)
+            for f in (self._file, self._index):
+                if f is not None:
+                    try:
+                        f.close()
+                    except OSError:
+                        pass
+        finally:
+            self._done.set()
+
+    def _write_blocks(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            block, n = item
+            timed = TELEMETRY.enabled
+            if timed:
+                t0 = time.perf_counter()
+            if self.version == 1:
+                self._file.write(BLOCK_PREFIX.pack(n, 0))
+                for name, _ in COLUMNS:
+                    self._file.write(block[name].data)
+            else:
+                self._write_chunk(block, n)
+            if timed:
+                TELEMETRY.observe("log.flush", time.perf_counter() - t0)
+            self._free.put(block)
+        self._file.close()
+        if self._index is not None:
+            self._index.close()
+        if self.export_csv:
+            export_csv(self.path, self.export_csv)
+
+    def _write_chunk(self, block, n):
+        compress = CODECS[self.codec][0]
+        payload = compress(b"".join(block[name][:n].tobytes() for name, _ in COLUMNS), self.level)
+        nbytes = BLOCK_PREFIX.size + len(payload)
+        if self.max_bytes and self._part_chunks and self._file.tell() + nbytes > self.max_bytes:
+            self._rotate()
+        offset = self._file.tell()
+        self._file.write(BLOCK_PREFIX.pack(n, len(payload)))
+        self._file.write(payload)
+        self._part_chunks += 1
+        entry = np.array([(self.part, n, offset, nbytes, block["index"][0],
+                           block["timestamp"][0], block["timestamp"][n - 1])], dtype=INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self._index.flush()  # a crash loses at most the chunk being written
+
+    def _rotate(self):
+        self._file.close()
+        self.part += 1
+        self._part_chunks = 0
+        self._file = open(part_path(self.path, self.part), "wb")
+        self._write_header()
+
+    def close(self, wait=True):
+        # writes the partial block; the CSV export (if any) runs on the writer thread
+        if self._closed:
+            return
+        self._closed = True
+        if self.error is None:
+            self._submit()
+        self._pending.put(None)
+        if wait:
+            self._done.wait()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class SessionLogReader:
+    # Either version. Blocks are numbered across all parts; version 1 blocks
+    # are views into a memory map, version 2 chunks are read and decompressed
+    # on demand (the last one is kept).
+    def __init__(self, path):
+        self.path = path
+        self.header, self.data_offset = self._read_header(path)
+        self.version = self.header.get("version", 1)
+        self.columns = [(name, np.dtype(dt)) for name, dt in self.header["columns"]]
+        self.block_rows = self.header["block_rows"]
+        self.chunks_read = 0  # version 2 chunks decompressed so far
+
+        if self.version >= 2:
+            self._decompress = CODECS[self.header.get("codec")][1]
+            self._files = {}
+            self._cached = (None, None)
+            self.index = self._load_index()
+            self.block_counts = self.index["rows"].astype(np.int64)
+            return
+
+        self.block_bytes = block_nbytes(self.block_rows, self.columns)
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r")
+        n_blocks = (len(self._mm) - self.data_offset) // self.block_bytes
+        self.block_counts = np.array(
+            [BLOCK_PREFIX.unpack_from(self._mm, self._block_offset(b))[0] for b in range(n_blocks)],
+            dtype=np.int64,
+        )
+
+    @staticmethod
+    def _read_header(path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an ergometer session log")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            return json.loads(f.read(header_len).decode()), len(MAGIC) + 4 + header_len
+
+    def __len__(self):
+        return int(self.block_counts.sum())
+
+    def close(self):
+        if self.version >= 2:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+        else:
+            self._mm = None
+
+    # --- version 2 ---------------------------------------------------------
+
+    def _load_index(self):
+        path = index_path(self.path)
+        if os.path.exists(path):
+            # a record cut short by a crash is dropped
+            count = os.path.getsize(path) // INDEX_DTYPE.itemsize
+            return np.fromfile(path, dtype=INDEX_DTYPE, count=count)
+        log.warning("%s has no chunk index, rebuilding it from the log", self.path)
+        return self._scan_index()
+
+    def _scan_index(self):
+        # walks the chunk prefixes of every part; decompresses each chunk once
+        entries = []
+        part = 0
+        while os.path.exists(part_path(self.path, part)):
+            _, offset = self._read_header(part_path(self.path, part))
+            f = self._part(part)
+            while True:
+                f.seek(offset)
+                prefix = f.read(BLOCK_PREFIX.size)
+                if len(prefix) < BLOCK_PREFIX.size:
+                    break
+                rows, length = BLOCK_PREFIX.unpack(prefix)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break  # chunk cut short by a crash
+                chunk = self._decode(rows, payload)
+                entries.append((part, rows, offset, BLOCK_PREFIX.size + length, chunk["index"][0],
+                                chunk["timestamp"][0], chunk["timestamp"][rows - 1]))
+                offset += BLOCK_PREFIX.size + length
+            part += 1
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def _part(self, part):
+        f = self._files.get(part)
+        if f is None:
+            f = self._files[part] = open(part_path(self.path, part), "rb")
+        return f
+
+    def _decode(self, rows, payload):
+        data = self._decompress(payload)
+        chunk, offset = {}, 0
+        for name, dt in self.columns:
+            chunk[name] = np.frombuffer(data, dtype=dt, count=rows, offset=offset)
+            offset += dt.itemsize * rows
+        return chunk
+
+    def _chunk(self, b):
+        cached_b, chunk = self._cached
+        if cached_b == b:
+            return chunk
+        entry = self.index[b]
+        f = self._part(int(entry["part"]))
+        f.seek(int(entry["offset"]) + BLOCK_PREFIX.size)
+        chunk = self._decode(int(entry["rows"]), f.read(int(entry["nbytes"]) - BLOCK_PREFIX.size))
+        self.chunks_read += 1
+        self._cached = (b, chunk)
+        return chunk
+
+    # --- version 1 ---------------------------------------------------------
+
+    def _block_offset(self, b):
+        return self.data_offset + b * self.block_bytes
+
+    def _column_offset(self, name):
+        offset = BLOCK_PREFIX.size
+        for col, dt in self.columns:
+            if col == name:
+                return offset
+            offset += dt.itemsize * self.block_rows
+        raise KeyError(name)
+
+    # --- both --------------------------------------------------------------
+
+    def block(self, b):
+        # one block's valid rows (zero-copy views for version 1)
+        if self.version >= 2:
+            return self._chunk(b)
+        offset = self._block_offset(b) + BLOCK_PREFIX.size
+        n = int(self.block_counts[b])
+        views = {}
+        for name, dt in self.columns:
+            views[name] = np.frombuffer(self._mm, dtype=dt, count=n, offset=offset)
+            offset += dt.itemsize * self.block_rows
+        return views
+
+    def block_first(self, name):
+        # first value of a column in every block, without touching the rest
+        if self.version >= 2:
+            if name == "timestamp":
+                return self.index["first_ts"].copy()
+            if name == "index":
+                return self.index["first_index"].copy()
+            return np.array([self.block(b)[name][0] for b in range(len(self.block_counts))])
+        dt = dict(self.columns)[name]
+        offsets = (self.data_offset + np.arange(len(self.block_counts)) * self.block_bytes
+                   + self._column_offset(name))
+        return np.array([np.frombuffer(self._mm, dtype=dt, count=1, offset=int(o))[0] for o in offsets])
+
+    def block_last(self, name):
+        # last valid value of a column in the final block (None for an empty log)
+        if not len(self.block_counts) or not self.block_counts[-1]:
+            return None
+        if self.version >= 2 and name == "timestamp":
+            return self.index["last_ts"][-1]
+        return self.block(len(self.block_counts) - 1)[name][-1]
+
+    def block_times(self):
+        # (first, last) timestamp of every block
+        if self.version >= 2:
+            return self.index["first_ts"], self.index["last_ts"]
+        dt = dict(self.columns)["timestamp"]
+        offsets = (self.data_offset + np.arange(len(self.block_counts)) * self.block_bytes
+                   + self._column_offset("timestamp") + (self.block_counts - 1) * dt.itemsize)
+        last = np.array([np.frombuffer(self._mm, dtype=dt, count=1, offset=int(o))[0] for o in offsets])
+        return self.block_first("timestamp"), last
+
+    def iter_blocks(self):
+        for b in range(len(self.block_counts)):
+            yield self.block(b)
+
+    def _concat(self, b0, b1):
+        blocks = [self.block(b) for b in range(b0, b1)]
+        return {name: np.concatenate([blk[name] for blk in blocks]) if blocks else np.empty(0, dt)
+                for name, dt in self.columns}
+
+    def read(self):
+        return self._concat(0, len(self.block_counts))
+
+    def read_rows(self, start, stop=None):
+        # rows start..stop-1 (0-based; the "index" column is 1-based), reading
+        # only the blocks that hold them
+        starts = np.concatenate([[0], np.cumsum(self.block_counts)])
+        stop = int(starts[-1]) if stop is None else min(stop, int(starts[-1]))
+        if start >= stop:
+            return self._concat(0, 0)
+        b0 = int(np.searchsorted(starts, start, "right")) - 1
+        b1 = int(np.searchsorted(starts, stop, "left"))
+        rows = self._concat(b0, b1)
+        skip = start - int(starts[b0])
+        return {name: values[skip:skip + stop - start] for name, values in rows.items()}
+
+    def read_time(self, t0, t1=None):
+        # rows with t0 <= timestamp <= t1, in seconds since the first sample,
+        # reading only the blocks that overlap that span
+        first, last = self.block_times()
+        if not len(first):
+            return self._concat(0, 0)
+        origin = float(first[0])
+        lo, hi = origin + t0, np.inf if t1 is None else origin + t1
+        b0 = int(np.searchsorted(last, lo, "left"))
+        b1 = int(np.searchsorted(first, hi, "right"))
+        rows = self._concat(b0, max(b0, b1))
+        keep = (rows["timestamp"] >= lo) & (rows["timestamp"] <= hi)
+        return {name: values[keep] for name, values in rows.items()}
+
+
+def session_paths(mode, out_dir="logs", ts=None):
+    # -> (session timestamp, {"log", "csv", "meta": paths}) for a new session
+    ts = ts or datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, f"{mode.replace(' ', '')}_{ts}")
+    n = 1
+    while os.path.exists(base + ".ergolog"):
+        # back-to-back headless runs can start within the same second
+        n += 1
+        base = os.path.join(out_dir, f"{mode.replace(' ', '')}_{ts}_{n}")
+    return ts, {"log": base + ".ergolog", "csv": base + ".csv", "meta": base + ".session.json"}
+
+
+def update_session_metadata(path, **sections):
+    # <session>.session.json sidecar (mode, plan, timing, ...), merged section by section
+    meta = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            meta = json.load(f)
+    meta.update(sections)
+    with open(path, "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def export_csv(log_path, csv_path=None):
+    # finished .ergolog -> the CSV layout the live graph has always written
+    reader = SessionLogReader(log_path)
+    csv_path = csv_path or os.path.splitext(log_path)[0] + ".csv"
+    session = reader.header.get("session") or ""
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for block in reader.iter_blocks():
+            writer.writerows(zip(
+                block["index"].astype(float).tolist(),
+                itertools.repeat(session),
+                *(block[name].tolist() for name, _ in DATA_ROWS)
+            ))
+    return csv_path
+
+
+if __name__ == "__main__":
+    # python session_log.py logs/Isometric_20250101_120000.ergolog [out.csv]
+    print(export_csv(*sys.argv[1:3]))
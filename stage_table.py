@@ -0,0 +1,166 @@
+import tkinter as tk
+
+# Stage editor for protocols of any length. The stages live in a StageModel
+# (plain lists, no Tk); VirtualStageTable only creates widgets for the rows
+# that fit on screen and points them at different model rows as it scrolls,
+# so a protocol with thousands of stages costs the same widgets as one with 16.
+
+N_FIELDS = 5  # name, total time, target, contraction time, rest time; then enabled
+
+
+def blank_row():
+    return [""] * N_FIELDS + [False]
+
+
+class StageModel:
+    # rows are [name, total, target, cont, rest, enabled], values as typed
+    def __init__(self, rows=()):
+        self._rows = [self._normalize(row) for row in rows]
+        self.version = 0  # bumped on every change
+        self._stages = (None, None)  # (version, parsed stages)
+
+    @staticmethod
+    def _normalize(row):
+        row = list(row)
+        fields = ["" if v is None else str(v) for v in row[:N_FIELDS]]
+        fields += [""] * (N_FIELDS - len(fields))
+        return fields + [bool(row[N_FIELDS]) if len(row) > N_FIELDS else False]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def row(self, index):
+        return self._rows[index] if index < len(self._rows) else blank_row()
+
+    def rows(self):
+        return [list(row) for row in self._rows]
+
+    def filled_rows(self):
+        # rows with anything typed in them
+        return [list(row) for row in self._rows if any(v.strip() for v in row[:N_FIELDS])]
+
+    def _changed(self):
+        self.version += 1
+
+    def load(self, rows):
+        self._rows = [self._normalize(row) for row in rows]
+        self._changed()
+
+    def set(self, index, column, value):
+        # writing past the end grows the model with blank rows
+        while len(self._rows) <= index:
+            self._rows.append(blank_row())
+        self._rows[index][column] = bool(value) if column == N_FIELDS else value
+        self._changed()
+
+    def insert(self, index, row=None):
+        self._rows.insert(index, self._normalize(row or blank_row()))
+        self._changed()
+
+    def delete(self, index):
+        if index < len(self._rows):
+            del self._rows[index]
+            self._changed()
+
+    def stages(self):
+        # parsed Stages for the plan compiler, reparsed only after an edit
+        from plan_compiler import stages_from_rows  # numpy, on first use
+        version, stages = self._stages
+        if version != self.version:
+            stages = stages_from_rows(self._rows)
+            self._stages = (self.version, stages)
+        return stages
+
+
+class VirtualStageTable:
+    # A header, `visible_rows` rows of Entry/Checkbutton widgets and a
+    # scrollbar. There is always one blank row after the last stage to type a
+    # new one into.
+    def __init__(self, master, model, columns, visible_rows=16, bg="white"):
+        self.model = model
+        self.visible_rows = visible_rows
+        self.first = 0  # model index shown in the top widget row
+        self._loading = False  # set while widgets are refilled from the model
+
+        self.frame = tk.Frame(master, bg=bg)
+        for col, col_name in enumerate(columns):
+            label = tk.Label(self.frame, text=col_name, borderwidth=1, relief="solid",
+                             font=("Times New Roman", 12, "bold"))
+            label.grid(row=0, column=col, sticky="nsew")
+            self.frame.grid_columnconfigure(col, weight=1, minsize=100)
+        self.frame.grid_columnconfigure(0, weight=2, minsize=100)
+
+        self.scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=len(columns), rowspan=visible_rows, sticky="ns")
+
+        self.index_labels = []
+        self.cells = []  # per widget row: N_FIELDS StringVars + one BooleanVar
+        for slot in range(visible_rows):
+            row_vars = []
+            for col in range(N_FIELDS):
+                var = tk.StringVar()
+                entry = tk.Entry(self.frame, textvariable=var, relief="solid",
+                                 width=25 if col == 0 else 15, font=("Georgia", 15))
+                entry.grid(row=slot + 1, column=col, sticky="nsew", padx=1, pady=1)
+                self._bind_wheel(entry)
+                var.trace_add("write", lambda *_, s=slot, c=col: self._on_edit(s, c))
+                row_vars.append(var)
+            var = tk.BooleanVar()
+            cb = tk.Checkbutton(self.frame, variable=var, bg=bg)
+            cb.grid(row=slot + 1, column=N_FIELDS, sticky="nsew", padx=1, pady=1)
+            self._bind_wheel(cb)
+            var.trace_add("write", lambda *_, s=slot: self._on_edit(s, N_FIELDS))
+            row_vars.append(var)
+            self.cells.append(row_vars)
+        self._bind_wheel(self.frame)
+
+        self.refresh()
+
+    @property
+    def row_count(self):
+        # model rows plus the blank one to type into, at least a screenful
+        return max(len(self.model) + 1, self.visible_rows)
+
+    def refresh(self):
+        # point the widget rows at model rows first..first+visible_rows
+        self.first = max(0, min(self.first, self.row_count - self.visible_rows))
+        self._loading = True
+        try:
+            for slot, row_vars in enumerate(self.cells):
+                row = self.model.row(self.first + slot)
+                for var, value in zip(row_vars, row):
+                    if var.get() != value:
+                        var.set(value)
+        finally:
+            self._loading = False
+        total = self.row_count
+        self.scrollbar.set(self.first / total, (self.first + self.visible_rows) / total)
+
+    def scroll_to(self, index):
+        self.first = index
+        self.refresh()
+
+    def _on_edit(self, slot, column):
+        if self._loading:
+            return
+        index = self.first + slot
+        self.model.set(index, column, self.cells[slot][column].get())
+        if index == len(self.model) - 1:
+            self.refresh()  # a new last row: grow the scroll range
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * self.row_count))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * (self.visible_rows - 1))
+        else:
+            self.scroll_to(self.first + int(amount))
+
+    def _bind_wheel(self, widget):
+        # the table scrolls itself; "break" keeps the page behind it still
+        def on_wheel(event):
+            self.scroll_to(self.first - (1 if event.delta > 0 else -1) * 3)
+            return "break"
+        widget.bind("<MouseWheel>", on_wheel)
+        widget.bind("<Button-4>", lambda e: (self.scroll_to(self.first - 3), "break")[1])
+        widget.bind("<Button-5>", lambda e: (self.scroll_to(self.first + 3), "break")[1])
@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import os
+import pickle
+
+log = logging.getLogger(__name__)
+
+# Scoped tag discovery for fast start. LogixDriver.open() normally uploads
+# every controller (and program) tag definition before the first read. With
+# init_tags=False we upload the controller-scoped list once, keep only the
+# tags the app uses, and cache those definitions on disk per controller,
+# keyed by its program signature. Later launches load them straight into the
+# driver (pycomm3 documents sharing definitions via `driver._tags`), after
+# one multi-tag read of every cached tag in full: a download that removes,
+# renames or resizes a tag doesn't change the signature, but fails that read.
+
+TAG_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ergometer", "tag_cache")
+
+
+def program_signature(info, tag_names):
+    # controller identity (product, serial, program name, firmware revision)
+    # + the tag set we ask for; program edits are caught by _verify
+    revision = info.get("revision") or {}
+    parts = [
+        info.get("product_name"), info.get("serial"), info.get("name"),
+        revision.get("major"), revision.get("minor"), ",".join(sorted(tag_names)),
+    ]
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def cache_path(cache_dir, ip, signature):
+    safe_ip = "".join(c if c.isalnum() else "_" for c in str(ip))
+    return os.path.join(cache_dir, f"{safe_ip}_{signature}.pickle")
+
+
+def _full_read(tag):
+    # the whole tag, arrays with every element, so a shrunk array fails too
+    dim = tag.get("dim", 0)
+    if not dim:
+        return tag["tag_name"]
+    count = 1
+    for size in tag["dimensions"][:dim]:
+        count *= size
+    return f"{tag['tag_name']}{{{count}}}"
+
+
+def _verify(driver, definitions):
+    # one multi-tag read; a stale definition comes back with an error
+    tag_names = [_full_read(tag) for tag in definitions.values()]
+    results = driver.read(*tag_names)
+    if len(tag_names) == 1:
+        results = [results]
+    return all(r.error is None for r in results)
+
+
+def load_scoped_tags(driver, ip, tag_names, cache_dir=TAG_CACHE_DIR):
+    # driver must be open and created with init_tags=False.
+    # Returns "cache" or "upload" depending on where the definitions came from;
+    # a failed upload raises (PLCInterface.connect falls back to init_tags).
+    signature = program_signature(driver.info, tag_names)
+    path = cache_path(cache_dir, ip, signature)
+
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                driver._tags = pickle.load(f)
+            if driver._tags and _verify(driver, driver._tags):
+                return "cache"
+        except Exception as e:
+            log.warning("Ignoring tag cache %s: %s", path, e)
+        driver._tags = {}
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # controller scope only; the app doesn't use program tags
+    uploaded = driver.get_tag_list(program=None, cache=False)
+    driver._tags = {t["tag_name"]: t for t in uploaded if t["tag_name"] in tag_names}
+    missing = set(tag_names) - set(driver._tags)
+    if missing:
+        log.warning("Tags not found on controller: %s", sorted(missing))
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(driver._tags, f)
+    except OSError as e:
+        log.warning("Could not write tag cache %s: %s", path, e)
+    return "upload"
@@ -0,0 +1,165 @@
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Hot-path instrumentation: latency histograms and counters, read through
+# snapshot() or a JSON file rewritten every few seconds.
+#
+# Disabled by default. Instrumented code checks TELEMETRY.enabled (one
+# attribute read) before taking any timestamps, so leaving the hooks in
+# costs next to nothing:
+#
+#   TELEMETRY.enable(snapshot_path="logs/telemetry.json")
+#   ...
+#   TELEMETRY.snapshot()["histograms"]["plc.read_frame"]["p99_ms"]
+
+log = logging.getLogger(__name__)
+
+# histogram bucket upper bounds in ms, roughly 4 per decade from 10 us to 10 s
+BUCKETS_MS = tuple(round(10 ** (e / 4), 4) for e in range(-8, 17))
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket: above the top bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th percentile
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 4) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 4),
+            "buckets_ms": dict(zip(map(str, self.bounds + ("inf",)), self.counts)),
+        }
+
+
+class Telemetry:
+    def __init__(self):
+        self.enabled = False
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._snapshot_path = None
+        self._snapshot_stop = threading.Event()
+        self._snapshot_thread = None
+
+    def enable(self, snapshot_path=None, interval=5.0):
+        self.enabled = True
+        if snapshot_path and self._snapshot_thread is None:
+            self._snapshot_path = snapshot_path
+            self._snapshot_stop.clear()
+            self._snapshot_thread = threading.Thread(
+                target=self._snapshot_loop, args=(interval,), name="telemetry", daemon=True
+            )
+            self._snapshot_thread.start()
+
+    def disable(self):
+        self.enabled = False
+        if self._snapshot_thread is not None:
+            self._snapshot_stop.set()
+            self._snapshot_thread.join(timeout=5)
+            self._snapshot_thread = None
+            self.write_snapshot(self._snapshot_path)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    # --- recording (callers check .enabled first) ------------------------
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.record(seconds * 1000)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def timed(self, name):
+        # decorator: latency histogram of every call
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                t0 = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - t0)
+            return wrapper
+        return decorate
+
+    # --- export ----------------------------------------------------------
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "since": self._started,
+                "enabled": self.enabled,
+                "counters": dict(self._counters),
+                "histograms": {name: h.summary() for name, h in self._histograms.items()},
+            }
+
+    def write_snapshot(self, path):
+        tmp = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)  # readers never see a half-written file
+
+    def _snapshot_loop(self, interval):
+        while not self._snapshot_stop.wait(interval):
+            try:
+                self.write_snapshot(self._snapshot_path)
+            except OSError as e:
+                log.warning("Could not write telemetry snapshot %s: %s", self._snapshot_path, e)
+
+
+TELEMETRY = Telemetry()
+
+
+def configure_logging(level=logging.INFO):
+    # console logging for the app entry points; library modules only log
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(levelname)-7s %(name)s: %(message)s",
+    )
@@ -0,0 +1,56 @@
+import numpy as np
+
+from acquisition import AcquisitionEngine
+from plc_interface import BATCH_SEQ_TAG, PLCInterface
+from plc_simulator import SimulatedLogixDriver
+
+
+def _sim_plc(**kwargs):
+    driver = SimulatedLogixDriver(latency=0, **kwargs)
+    plc = PLCInterface('sim', lambda ip, **kw: driver)
+    assert plc.connect()
+    return plc, driver
+
+
+def test_engine_runs_plan_and_disables_test_mode():
+    plc, driver = _sim_plc(fill_rate=60)
+    plc.enable_test_mode(1)
+    batches = []
+    engine = AcquisitionEngine(plc, np.zeros(15), 'matlabTorque', rate_hz=30,
+                               on_batch=lambda ts, m: batches.append(m), seq_tag=BATCH_SEQ_TAG)
+    engine.start()
+    assert engine.wait(5)
+    assert engine.error is None
+    assert engine.finished.is_set()
+    assert driver.tags['matlabTestingEnabled'] == 0
+    assert engine.ring.count == 15
+    assert batches and engine.batches.batches == len(batches)
+
+
+def test_engine_error_disables_test_mode():
+    plc, driver = _sim_plc(fill_rate=200)
+    plc.enable_test_mode(1)
+
+    def on_batch(timestamp, data_matrix):
+        raise OSError("disk full")
+
+    engine = AcquisitionEngine(plc, np.zeros(300), 'matlabTorque', rate_hz=30, on_batch=on_batch)
+    engine.start()
+    assert engine.wait(5)
+    assert engine.error == "OSError: disk full"
+    assert engine.finished.is_set()
+    assert driver.tags['matlabTestingEnabled'] == 0
+
+
+def test_engine_retries_lost_velocity_limit():
+    plc, driver = _sim_plc(fill_rate=0)
+    plan = np.zeros(4)
+    engine = AcquisitionEngine(plc, plan, 'matlabPosition',
+                               velocity_schedule=(np.array([0]), np.array([40])))
+    plc.disconnect()
+    engine._tick(0)
+    assert engine.lost_commands == 1 and engine.lost_samples == 1
+    assert plc.connect()
+    engine._tick(1)
+    assert driver.tags['matlabVelocityLimit'] == 40
+    assert engine.lost_commands == 1
@@ -0,0 +1,69 @@
+from batch_handshake import BatchHandshake, BatchTracker
+from plc_interface import BATCH_SEQ_TAG, CACHE_COLS, CACHE_ROWS, PLCInterface
+from plc_simulator import SimulatedLogixDriver
+
+
+def test_tracker_counts_gaps_and_drops_repeats():
+    tracker = BatchTracker()
+    assert tracker.accept(1)
+    assert tracker.accept(2)
+    assert tracker.accept(5)
+    assert not tracker.accept(5)
+    assert tracker.report() == {"batches": 3, "missed_batches": 2, "duplicate_batches": 1}
+
+
+def test_tracker_follows_dint_wrap():
+    tracker = BatchTracker()
+    tracker.accept(2**31 - 1)
+    tracker.accept(-2**31)
+    assert tracker.missed == 0 and tracker.batches == 2
+
+
+def test_tracker_without_counter():
+    tracker = BatchTracker()
+    assert tracker.accept() and tracker.accept()
+    assert tracker.report() == {"batches": 2, "missed_batches": None, "duplicate_batches": None}
+
+
+def _handshake(fill_rate):
+    driver = SimulatedLogixDriver(latency=0, fill_rate=fill_rate)
+    plc = PLCInterface('sim', lambda ip, **kw: driver)
+    assert plc.connect()
+    return BatchHandshake(plc, seq_tag=BATCH_SEQ_TAG), driver
+
+
+def test_poll_acknowledges_batch_and_writes_limit():
+    handshake, driver = _handshake(fill_rate=0)
+    driver._fill(0.01, 0.01)
+    live, batch = handshake.poll(velocity_limit=30)
+    assert set(live) == {'matlabTorque', 'matlabPosition', BATCH_SEQ_TAG}
+    assert len(batch) == CACHE_ROWS and len(batch[0]) == CACHE_COLS
+    assert driver.tags['NewDataFlag'] == 0
+    assert driver.tags['matlabVelocityLimit'] == 30
+
+
+def test_poll_reports_overrun_batches():
+    handshake, driver = _handshake(fill_rate=0)
+    driver._fill(0.01, 0.01)
+    handshake.poll(live=False)
+    # the PLC refills twice before the next poll acknowledges
+    for i in range(3):
+        driver._fill(0.02 + i * 0.01, 0.01)
+    assert handshake.poll(live=False)[1] is not None
+    assert handshake.batches.missed == driver.batches_dropped == 2
+
+
+def test_poll_drops_batch_read_twice():
+    handshake, driver = _handshake(fill_rate=0)
+    driver.tags['NewDataFlag'] = 1
+    assert handshake.poll()[1] is not None
+    # the flag reset didn't get through: the same batch is posted again
+    driver.tags['NewDataFlag'] = 1
+    assert handshake.poll()[1] is None
+    assert handshake.batches.duplicates == 1
+
+
+def test_poll_without_link():
+    handshake, driver = _handshake(fill_rate=0)
+    handshake.plc.disconnect()
+    assert handshake.poll() is None
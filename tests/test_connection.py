@@ -0,0 +1,101 @@
+import time
+
+from pycomm3 import CommError, ResponseError
+
+from connection_manager import CONNECTED, ConnectionManager
+from plc_interface import PLCInterface
+from plc_simulator import SimulatedLogixDriver
+
+
+class FlakyFactory:
+    # driver_factory whose first `failures` opens raise `error`
+    def __init__(self, failures=0, error=CommError):
+        self.failures = failures
+        self.error = error
+        self.drivers = []
+
+    def __call__(self, ip, **kwargs):
+        driver = SimulatedLogixDriver(ip, latency=0, fill_rate=0, **kwargs)
+        self.drivers.append(driver)
+        if self.failures:
+            self.failures -= 1
+            error = self.error
+
+            def open():
+                driver.connected = True
+                raise error("simulated failure")
+            driver.open = open
+        return driver
+
+
+def _wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_connect_response_error_closes_driver():
+    factory = FlakyFactory(failures=1, error=ResponseError)
+    plc = PLCInterface('sim', factory)
+    assert plc.connect() is False
+    assert not plc.connected
+    assert not factory.drivers[0].connected
+    assert plc.connect()
+
+
+def test_fast_start_falls_back_to_full_upload(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ResponseError("upload failed")
+    monkeypatch.setattr("plc_interface.load_scoped_tags", fail)
+    factory = FlakyFactory()
+    plc = PLCInterface('sim', factory, fast_start=True)
+    assert plc.connect()
+    first, second = factory.drivers
+    assert not first.connected
+    assert plc.plc is second and second.init_tags
+
+
+def test_manager_reconnects_with_backoff():
+    factory = FlakyFactory(failures=3, error=ResponseError)
+    manager = ConnectionManager('sim', factory, backoff_initial=0.01, backoff_max=0.05)
+    manager.start()
+    try:
+        assert _wait_for(lambda: manager.state == CONNECTED)
+        assert all(not d.connected for d in factory.drivers[:3])
+    finally:
+        manager.stop()
+
+
+def test_manager_recovers_a_dropped_session():
+    manager = ConnectionManager('sim', FlakyFactory(), keepalive_interval=0.01,
+                                backoff_initial=0.01, backoff_max=0.05)
+    manager.start()
+    try:
+        assert _wait_for(lambda: manager.state == CONNECTED)
+        manager.stream.plc.close()  # the next request on it fails
+        assert manager.stream.read_many('matlabTorque') is None
+        assert _wait_for(lambda: manager.state == CONNECTED and manager.outages == 1)
+        assert manager.stream.read_many('matlabTorque') is not None
+    finally:
+        manager.stop()
+
+
+def test_manager_survives_a_failing_pass(monkeypatch):
+    manager = ConnectionManager('sim', FlakyFactory(), backoff_initial=0.01, backoff_max=0.05)
+    real_pass, calls = manager._pass, []
+
+    def flaky_pass():
+        calls.append(1)
+        if len(calls) <= 2:
+            raise RuntimeError("boom")
+        real_pass()
+    monkeypatch.setattr(manager, "_pass", flaky_pass)
+    manager.start()
+    try:
+        assert _wait_for(lambda: manager.state == CONNECTED)
+        assert manager._thread.is_alive()
+    finally:
+        manager.stop()
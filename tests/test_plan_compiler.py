@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+import plan_compiler
+from plan_compiler import Stage, compile_plan, plan_key
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    plan_compiler.clear_cache()
+    yield
+    plan_compiler.clear_cache()
+
+
+STAGES = [
+    Stage("warm up", 2, 10, 1, 1, True),
+    Stage("skipped", 5, 99, 5, 0, False),
+    Stage("work", 1, 20, 0.5, 0.5, True),
+]
+
+
+def test_compile_signal():
+    plan = compile_plan(STAGES, frame_rate=10)
+    assert len(plan) == 30
+    assert list(plan.stage_starts) == [0, 20, 30]
+    assert list(plan.signal[:10]) == [10] * 10 and not plan.signal[10:20].any()
+    assert list(plan.signal[20:25]) == [20] * 5
+    assert not plan.signal.flags.writeable
+
+
+def test_negative_times_give_empty_stage():
+    plan = compile_plan([Stage("bad", -1, 10, -2, 0, True), Stage("ok", 1, 5, 1, 0, True)],
+                        frame_rate=10)
+    assert list(plan.stage_starts) == [0, 0, 10]
+    assert list(plan.signal) == [5] * 10
+
+
+def test_memoized_in_process():
+    assert compile_plan(STAGES) is compile_plan([list(s) for s in STAGES])
+    assert compile_plan(STAGES) is not compile_plan(STAGES[:1])
+
+
+def test_disk_cache_round_trip(tmp_path):
+    plan = compile_plan(STAGES, cache_dir=str(tmp_path))
+    path = tmp_path / (plan_key(STAGES) + ".npz")
+    assert path.exists()
+
+    plan_compiler.clear_cache()
+    loaded = compile_plan(STAGES, cache_dir=str(tmp_path))
+    assert loaded is not plan
+    assert np.array_equal(loaded.signal, plan.signal)
+    assert np.array_equal(loaded.stage_starts, plan.stage_starts)
+    for a, b in zip(loaded.velocity_schedule, plan.velocity_schedule):
+        assert np.array_equal(a, b)
+
+
+def test_corrupt_disk_plan_is_recompiled(tmp_path):
+    path = tmp_path / (plan_key(STAGES) + ".npz")
+    path.write_bytes(b"not a plan")
+    plan = compile_plan(STAGES, cache_dir=str(tmp_path))
+    assert len(plan) == 90
+    with np.load(str(path)) as data:
+        assert np.array_equal(data["signal"], plan.signal)
+
+
+def test_key_ignores_disabled_stages():
+    assert plan_key(STAGES) == plan_key([s for s in STAGES if s.enabled])
+    assert plan_key(STAGES) != plan_key(STAGES, frame_rate=60)
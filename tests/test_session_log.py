@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from session_log import BinarySessionLog, SessionLogReader, index_path, part_path
+
+
+def _batch(first, cols=10):
+    values = np.arange(first, first + cols, dtype=float)
+    return [list(values), list(values * 2), list(values * 3), list(values * 4)]
+
+
+def _write(path, batches, **kwargs):
+    log = BinarySessionLog(str(path), mode="Isometric", block_rows=16, **kwargs)
+    for i in range(batches):
+        log.append_batch(100.0 + i, _batch(i * 10))
+    log.close()
+    assert log.error is None
+    return log
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"codec": "zlib"}, {"codec": "zlib", "max_bytes": 600}])
+def test_round_trip(tmp_path, kwargs):
+    _write(tmp_path / "s.ergolog", 10, **kwargs)
+    reader = SessionLogReader(str(tmp_path / "s.ergolog"))
+    rows = reader.read()
+    assert len(reader) == 100
+    assert list(rows["index"]) == list(range(1, 101))
+    assert np.allclose(rows["position"], np.arange(100))
+    assert np.allclose(rows["torque"], np.arange(100) * 2)
+    reader.close()
+
+
+def test_rotation_writes_parts_and_index(tmp_path):
+    path = tmp_path / "s.ergolog"
+    _write(path, 20, codec="zlib", max_bytes=600)
+    assert os.path.exists(part_path(str(path), 1))
+    reader = SessionLogReader(str(path))
+    assert reader.index["part"].max() >= 1
+    assert reader.index["rows"].sum() == 200
+    reader.close()
+
+
+def test_index_reads_touch_only_needed_chunks(tmp_path):
+    path = tmp_path / "s.ergolog"
+    _write(path, 20, codec="zlib", max_bytes=600)
+    reader = SessionLogReader(str(path))
+    rows = reader.read_rows(40, 45)
+    assert list(rows["index"]) == [41, 42, 43, 44, 45]
+    assert reader.chunks_read == 1
+
+    rows = reader.read_time(5, 6)
+    assert set(rows["timestamp"]) == {105.0, 106.0}
+    assert len(rows["index"]) == 20
+    reader.close()
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    path = tmp_path / "s.ergolog"
+    _write(path, 20, codec="zlib", max_bytes=600)
+    expected = SessionLogReader(str(path)).index
+    os.remove(index_path(str(path)))
+    reader = SessionLogReader(str(path))
+    assert np.array_equal(reader.index, expected)
+    assert len(reader.read_rows(0)["index"]) == 200
+    reader.close()
+
+
+def test_writer_failure_stops_appends(tmp_path):
+    log = BinarySessionLog(str(tmp_path / "s.ergolog"), block_rows=16)
+    log._file.close()  # the writer's next write fails
+    log.append_batch(1.0, _batch(0))
+    with pytest.raises(OSError):
+        for i in range(1, 10):
+            log.append_batch(1.0 + i, _batch(i * 10))
+            log.wait(0.05)
+    assert log.error is not None
+    log.close()